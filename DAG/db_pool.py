@@ -0,0 +1,78 @@
+import os
+import time
+from typing import Dict
+
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+# 异步引擎的连接池配置 (全部可用环境变量覆盖)：
+# 默认的 pool_size=5 / max_overflow=10 在并发检索时很快就会被占满，后面的请求只能排队等连接。
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))          # 常驻连接数
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))    # 高峰期允许临时多开的连接数
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # 等连接的最长时间 (秒)，超时抛 TimeoutError
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # 连接用了多少秒后重建 (防止被数据库/防火墙悄悄断开)
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"  # 取连接时先 ping 一下，坏连接自动替换
+# asyncpg 的预编译语句缓存 (每个连接一份)：同样的检索 SQL 只 prepare 一次，之后只传参数
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "500"))
+DB_ECHO = os.getenv("DB_ECHO", "0") == "1"  # 打印每条 SQL，只在调试时打开 (会消耗大量 CPU)
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """在默认连接池基础上统计：正在等连接的请求数、等连接的次数和总耗时"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.waiting = 0
+        self.acquired = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _do_get(self):
+        # 包括直接拿到空闲连接、新建连接、排队等别人归还连接三种情况
+        self.waiting += 1
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - started
+            self.waiting -= 1
+            self.acquired += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+
+def engine_url(database_url: str) -> str:
+    """给 asyncpg 的 URL 加上预编译语句缓存大小"""
+    sep = "&" if "?" in database_url else "?"
+    return f"{database_url}{sep}prepared_statement_cache_size={DB_STATEMENT_CACHE_SIZE}"
+
+
+def engine_options() -> Dict:
+    """create_async_engine 的连接池参数"""
+    return {
+        "echo": DB_ECHO,
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+def pool_stats(engine) -> Dict[str, float]:
+    """连接池使用情况：已借出的连接、空闲连接、超出 pool_size 的连接、等待者、平均/最大等待时间"""
+    pool = engine.pool
+    stats = {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+    }
+    if isinstance(pool, InstrumentedQueuePool):
+        stats.update({
+            "waiting": pool.waiting,
+            "acquired": pool.acquired,
+            "avg_wait_ms": pool.wait_seconds / pool.acquired * 1000 if pool.acquired else 0.0,
+            "max_wait_ms": pool.max_wait_seconds * 1000,
+        })
+    return stats
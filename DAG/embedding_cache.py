@@ -0,0 +1,124 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+class EmbeddingCache:
+    """
+    向量缓存：key = sha256(模型名/版本 + 清洗后的文本)
+    - 内存层：LRU，有条目数上限和过期时间 (TTL)
+    - 磁盘层 (可选)：SQLite 文件，进程重启后仍然有效；过期的行在打开时和写入时 (最多每分钟一次) 删除
+    换了模型名/版本，key 就全变了，旧向量自然不会被命中 (打开磁盘缓存时也会顺手清掉旧模型的数据)。
+    向量化在线程池里执行，所以所有操作都加锁。
+    """
+
+    def __init__(self, model_name: str, max_entries: int = 10000, ttl_seconds: float = 3600,
+                 disk_path: Optional[str] = None):
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (向量, 过期时间)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._disk = None
+        self._last_prune = 0.0
+        if disk_path:
+            self._disk = sqlite3.connect(disk_path, check_same_thread=False)
+            self._disk.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings "
+                "(key TEXT PRIMARY KEY, model TEXT NOT NULL, vector BLOB NOT NULL, created REAL NOT NULL)"
+            )
+            self._disk.execute("CREATE INDEX IF NOT EXISTS ix_embeddings_created ON embeddings (created)")
+            self._disk.execute("DELETE FROM embeddings WHERE model != ?", (model_name,))
+            self._prune_locked(time.time())
+            self._disk.commit()
+
+    def _prune_locked(self, now: float) -> None:
+        """删掉磁盘层里过期的行，否则 SQLite 文件会无限增长"""
+        self._disk.execute("DELETE FROM embeddings WHERE created < ?", (now - self.ttl_seconds,))
+        self._last_prune = now
+
+    def key(self, cleaned_text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{cleaned_text}".encode("utf-8")).hexdigest()
+
+    def get(self, cleaned_text: str) -> Optional[np.ndarray]:
+        return self.get_many([cleaned_text])[cleaned_text]
+
+    def get_many(self, cleaned_texts: List[str]) -> Dict[str, Optional[np.ndarray]]:
+        """批量查缓存，返回 {文本: 向量或 None}"""
+        now = time.time()
+        found = {}
+        with self._lock:
+            for text in cleaned_texts:
+                vector = self._get_locked(self.key(text), now)
+                if vector is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+                found[text] = vector
+        return found
+
+    def _get_locked(self, key: str, now: float) -> Optional[np.ndarray]:
+        entry = self._memory.get(key)
+        if entry is not None:
+            vector, expires_at = entry
+            if expires_at > now:
+                self._memory.move_to_end(key)  # 最近用过，挪到 LRU 队尾
+                return vector
+            del self._memory[key]
+
+        if self._disk is not None:
+            row = self._disk.execute(
+                "SELECT vector, created FROM embeddings WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and row[1] + self.ttl_seconds > now:
+                vector = np.frombuffer(row[0], dtype=np.float32)
+                self.disk_hits += 1
+                self._remember_locked(key, vector, now)
+                return vector
+        return None
+
+    def put(self, cleaned_text: str, vector) -> None:
+        self.put_many({cleaned_text: vector})
+
+    def put_many(self, vectors: Dict[str, np.ndarray]) -> None:
+        now = time.time()
+        with self._lock:
+            rows = []
+            for text, vector in vectors.items():
+                key = self.key(text)
+                # 复制一份：encode 返回的是整批的矩阵，按行切出来的视图会让整批矩阵一直留在内存里，
+                # 也不能把调用方自己的数组设成只读
+                vector = np.array(vector, dtype=np.float32, copy=True)
+                self._remember_locked(key, vector, now)
+                rows.append((key, self.model_name, vector.tobytes(), now))
+            if self._disk is not None and rows:
+                self._disk.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+                if now - self._last_prune > 60:
+                    self._prune_locked(now)
+                self._disk.commit()
+
+    def _remember_locked(self, key: str, vector: np.ndarray, now: float) -> None:
+        vector.flags.writeable = False  # 缓存里的数组是共享的，禁止调用方原地修改
+        self._memory[key] = (vector, now + self.ttl_seconds)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)  # 淘汰最久没用过的
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "memory_entries": len(self._memory),
+        }
@@ -0,0 +1,176 @@
+import asyncio
+import hashlib
+import json
+import time
+from typing import Iterable, Iterator, List, Set
+
+from sqlalchemy import insert, select
+
+# 批量导入流水线：
+#   读取文档 -> 按 embed_batch_size 分批 -> 一次 model.encode 整批向量化 (线程池)
+#   -> 有界队列 (背压：写库跟不上时，向量化会停下来等) -> 按 write_chunk_size 分块，一块一个事务写库
+# 相比 add_document 的 "一条文档一次模型调用 + 一次 commit"，几十万条文档也能导入。
+# 导入是幂等的：每行记录 content_hash，库里已有的文档在向量化之前就会被跳过，重复导入同一个文件不会产生重复行。
+
+
+def content_hash(text: str) -> str:
+    """原始文本的 sha256，用来判断文档是否已导入 / 内容是否变化"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def read_documents(path: str) -> Iterator[str]:
+    """
+    从文件流式读取文档 (不会一次性读进内存)：
+    - .jsonl: 每行一个 JSON 对象，取 "content" 或 "text" 字段
+    - 其他: 每行一条文档，空行跳过
+    """
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if path.endswith(".jsonl"):
+                record = json.loads(line)
+                line = record.get("content") or record.get("text") or ""
+                if not line:
+                    continue
+            yield line
+
+
+def _batched(documents: Iterable[str], size: int) -> Iterator[List[str]]:
+    batch = []
+    for doc in documents:
+        batch.append(doc)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+_COLUMNS = ("raw_content", "embedding", "segmented_content", "content_hash", "model_version")
+
+
+async def _new_documents(session_factory, table, texts: List[str], seen: Set[str]) -> List[str]:
+    """去掉库里已有的、以及这次导入里已经出现过的文档 (seen 会被更新)"""
+    by_hash = {h: t for h, t in ((content_hash(t), t) for t in texts) if h not in seen}
+    seen.update(by_hash)
+    if not by_hash:
+        return []
+    async with session_factory() as session:
+        existing = await session.execute(
+            select(table.c.content_hash).where(table.c.content_hash.in_(list(by_hash)))
+        )
+        for (known,) in existing:
+            by_hash.pop(known, None)
+    return list(by_hash.values())
+
+
+async def _write_chunk(session_factory, table, rows, use_copy):
+    """一个块一个事务：多行 INSERT (或 COPY) 后只 commit 一次"""
+    async with session_factory() as session:
+        async with session.begin():
+            if use_copy:
+                # COPY 是 PostgreSQL 最快的批量写入方式，需要拿到底层的 asyncpg 连接
+                from pgvector.asyncpg import register_vector
+                conn = await session.connection()
+                raw = (await conn.get_raw_connection()).driver_connection
+                await register_vector(raw)
+                await raw.copy_records_to_table(
+                    table.name,
+                    records=[tuple(row[c] for c in _COLUMNS) for row in rows],
+                    columns=list(_COLUMNS),
+                )
+            else:
+                # executemany 形式的 insert，SQLAlchemy 会把它合并成多行 INSERT ... VALUES (...), (...)
+                await session.execute(insert(table), rows)
+
+
+async def bulk_ingest(
+    documents: Iterable[str],
+    processor,
+    session_factory,
+    table,
+    embed_batch_size: int = 64,
+    write_chunk_size: int = 1000,
+    max_pending_batches: int = 8,
+    use_copy: bool = False,
+) -> int:
+    """
+    流式批量导入，返回写入的文档数
+    documents: 任意可迭代对象 (列表、生成器、read_documents(path) ...)
+    processor: 提供 get_embeddings(texts)、segment_for_index(texts) 和 model_version 的 NLP 处理器
+    table: 目标表 (例如 KnowledgeBase.__table__)
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending_batches)
+    started = time.perf_counter()
+
+    async def embed_stage():
+        seen: Set[str] = set()
+        try:
+            for texts in _batched(documents, embed_batch_size):
+                # 已经导入过的文档不再向量化
+                texts = await _new_documents(session_factory, table, texts, seen)
+                if not texts:
+                    continue
+                # 模型计算是 CPU 密集型的，整批扔到线程里跑，不阻塞事件循环
+                vectors = await asyncio.to_thread(processor.get_embeddings, texts)
+                # 启用了关键词阶段时顺便分词，供全文检索使用 (未启用时全是 None)
+                segmented = await asyncio.to_thread(processor.segment_for_index, texts)
+                # 队列满时会在这里等待写库阶段消化 (背压)
+                await queue.put((texts, vectors, segmented))
+        finally:
+            await queue.put(None)  # 结束标记
+
+    async def write_stage():
+        written = 0
+        rows = []
+        while True:
+            item = await queue.get()
+            if item is not None:
+                texts, vectors, segmented = item
+                rows.extend(
+                    {
+                        "raw_content": text,
+                        "embedding": vector,
+                        "segmented_content": tokens,
+                        "content_hash": content_hash(text),
+                        "model_version": processor.model_version,
+                    }
+                    for text, vector, tokens in zip(texts, vectors, segmented)
+                )
+            if rows and (item is None or len(rows) >= write_chunk_size):
+                await _write_chunk(session_factory, table, rows, use_copy)
+                written += len(rows)
+                rows = []
+                elapsed = time.perf_counter() - started
+                print(f"   📦 Ingested {written} docs ({written / elapsed:.0f} docs/s)")
+            if item is None:
+                return written
+
+    embed_task = asyncio.create_task(embed_stage())
+    try:
+        written = await write_stage()
+    except BaseException:
+        embed_task.cancel()
+        raise
+    await embed_task  # 把向量化阶段的异常抛出来
+    return written
+
+
+if __name__ == "__main__":
+    import sys
+
+    import main
+
+    async def _ingest_file(path):
+        main.nlp_processor = main.ChineseNLPProcessor()
+        await main.init_db()  # 非破坏性：只建缺少的表/列
+        count = await bulk_ingest(
+            read_documents(path), main.nlp_processor, main.AsyncSessionLocal, main.KnowledgeBase.__table__,
+        )
+        print(f"✅ Ingested {count} documents from {path}")
+        await main.build_index()
+        await main.engine.dispose()
+
+    asyncio.run(_ingest_file(sys.argv[1]))
@@ -0,0 +1,37 @@
+from typing import List
+
+
+class KeywordExtractor:
+    """
+    关键词提取 (可选阶段)：BERT 类模型做向量化时不需要分词，
+    所以 jieba 只在这里使用，并且第一次真正用到时才导入、加载词典 (加载要 1 秒左右)。
+    """
+
+    def __init__(self, top_k: int = 10):
+        self.top_k = top_k
+        self._jieba = None
+        self._analyse = None
+
+    def _load(self):
+        if self._jieba is None:
+            import jieba
+            import jieba.analyse
+            jieba.initialize()  # 加载词典
+            self._jieba, self._analyse = jieba, jieba.analyse
+        return self._jieba
+
+    def segment(self, text: str) -> List[str]:
+        """分词，去掉空白"""
+        return [word for word in self._load().lcut(text) if word.strip()]
+
+    def segment_for_search(self, text: str) -> str:
+        """
+        搜索引擎模式分词 (长词会再切出短词，召回更高)，用空格连接后交给 PostgreSQL 的 'simple' 全文检索配置
+        (PostgreSQL 自带的分词器不会切中文，所以中文分词在应用里用 jieba 做)
+        """
+        return " ".join(word for word in self._load().lcut_for_search(text) if word.strip())
+
+    def extract(self, text: str, top_k: int = None) -> List[str]:
+        """按 TF-IDF 提取关键词，适合建立关键词索引"""
+        self._load()
+        return self._analyse.extract_tags(text, topK=top_k or self.top_k)
@@ -0,0 +1,160 @@
+"""
+knowledge_base 向量的紧凑存储：迁移 + 基准测试
+
+索引里的向量可以用 halfvec (半精度) 或 binary (二值量化) 表示 (见 vector_index.py)，
+查询时先用量化索引取候选，再用表里的 float32 向量精确重排序 (main.nearest_neighbors)。
+
+用法 (在 DAG 目录下)：
+    # 给已有数据建半精度索引 (表达式索引，不改表结构、不重写已有的行)，建好后删掉 float32 索引
+    python quantize.py migrate --storage halfvec --drop-old
+    # 对比各种表示的索引大小、recall@k、查询延迟，结果以 JSON 输出
+    python quantize.py benchmark --queries 200 --k 10 --output quantize.json
+切换线上查询用的表示：EMBEDDING_STORAGE=halfvec python main.py
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import numpy as np
+from sqlalchemy import select, text
+
+import main
+from vector_index import STORAGES, create_vector_index, index_name, set_search_params
+
+TABLE = main.KnowledgeBase.__tablename__
+# VECTOR_INDEX=none 时也要有索引才能比较，默认用 hnsw
+INDEX_METHOD = main.VECTOR_INDEX if main.VECTOR_INDEX != "none" else "hnsw"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="knowledge_base 向量的紧凑存储")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    migrate = sub.add_parser("migrate", help="给已有的行建量化索引")
+    migrate.add_argument("--storage", choices=STORAGES, required=True)
+    migrate.add_argument("--drop-old", action="store_true", help="建好后删掉其他表示的索引")
+
+    bench = sub.add_parser("benchmark", help="对比各种表示的大小、召回率和延迟")
+    bench.add_argument("--storages", nargs="+", choices=STORAGES, default=list(STORAGES))
+    bench.add_argument("--queries", type=int, default=200, help="从表里随机抽多少个向量当查询")
+    bench.add_argument("--k", type=int, default=10)
+    bench.add_argument("--candidates", type=int, default=main.RERANK_CANDIDATES, help="重排序的候选数")
+    bench.add_argument("--ef-search", type=int, default=None)
+    bench.add_argument("--output", default=None, help="结果 JSON 的保存路径 (默认只打印)")
+    return parser.parse_args()
+
+
+async def build_storage_index(storage: str):
+    async with main.engine.begin() as conn:
+        return await create_vector_index(
+            conn, TABLE, "embedding",
+            method=INDEX_METHOD,
+            distance=main.VECTOR_DISTANCE,
+            m=main.HNSW_M, ef_construction=main.HNSW_EF_CONSTRUCTION, lists=main.IVFFLAT_LISTS,
+            storage=storage, dim=main.EMBEDDING_DIM,
+        )
+
+
+async def relation_size(name: str) -> int:
+    """表/索引占用的字节数 (不存在时返回 0)"""
+    async with main.engine.connect() as conn:
+        size = await conn.execute(text("SELECT pg_total_relation_size(to_regclass(:name))"), {"name": name})
+        return size.scalar_one() or 0
+
+
+async def migrate(args):
+    name = await build_storage_index(args.storage)
+    if args.drop_old:
+        async with main.engine.begin() as conn:
+            for storage in STORAGES:
+                if storage != args.storage:
+                    old = index_name(TABLE, "embedding", INDEX_METHOD, main.VECTOR_DISTANCE, storage)
+                    await conn.execute(text(f"DROP INDEX IF EXISTS {old}"))
+    print(f"✅ {name}: {await relation_size(name) / 2**20:.1f} MiB, "
+          f"table {TABLE}: {await relation_size(TABLE) / 2**20:.1f} MiB")
+    print(f"   Set EMBEDDING_STORAGE={args.storage} to query through it.")
+
+
+async def sample_queries(count: int) -> np.ndarray:
+    async with main.AsyncSessionLocal() as session:
+        rows = await session.execute(
+            select(main.KnowledgeBase.embedding).order_by(text("random()")).limit(count)
+        )
+        return np.stack([np.asarray(v, dtype=np.float32) for v in rows.scalars()])
+
+
+async def ground_truth(queries: np.ndarray, k: int):
+    """关掉索引扫描，用 float32 向量做精确 (全表) 检索，作为 recall 的基准"""
+    truth = []
+    async with main.AsyncSessionLocal() as session:
+        for query in queries:
+            await session.execute(text("SET LOCAL enable_indexscan = off"))
+            result = await session.execute(main.nearest_neighbors(query.tolist(), k, storage="vector"))
+            truth.append({row.id for row in result})
+            await session.commit()
+    return truth
+
+
+async def measure(storage: str, queries: np.ndarray, truth, args):
+    latencies, recalls = [], []
+    async with main.AsyncSessionLocal() as session:
+        for query, expected in zip(queries, truth):
+            started = time.perf_counter()
+            await set_search_params(session, ef_search=args.ef_search,
+                                    min_rows=main.index_rows(args.k, storage, args.candidates))
+            stmt = main.nearest_neighbors(query.tolist(), args.k, storage=storage, candidates=args.candidates)
+            found = {row.id for row in await session.execute(stmt)}
+            await session.commit()
+            latencies.append((time.perf_counter() - started) * 1000)
+            recalls.append(len(found & expected) / max(len(expected), 1))
+
+    name = index_name(TABLE, "embedding", INDEX_METHOD, main.VECTOR_DISTANCE, storage)
+    bits = {"vector": 32, "halfvec": 16, "binary": 1}[storage]
+    latencies = np.asarray(latencies)
+    return {
+        "index": name,
+        "index_bytes": await relation_size(name),
+        "bytes_per_vector": main.EMBEDDING_DIM * bits // 8,
+        f"recall@{args.k}": float(np.mean(recalls)),
+        "latency_ms": {
+            "mean": float(latencies.mean()),
+            "p50": float(np.percentile(latencies, 50)),
+            "p95": float(np.percentile(latencies, 95)),
+            "p99": float(np.percentile(latencies, 99)),
+        },
+    }
+
+
+async def benchmark(args):
+    queries = await sample_queries(args.queries)
+    truth = await ground_truth(queries, args.k)
+    report = {
+        "config": {**vars(args), "distance": main.VECTOR_DISTANCE, "queries": len(queries)},
+        "table_bytes": await relation_size(TABLE),
+        "storages": {},
+    }
+    for storage in args.storages:
+        await build_storage_index(storage)
+        report["storages"][storage] = await measure(storage, queries, truth, args)
+        print(f"   📏 {storage}: {report['storages'][storage]}")
+    return report
+
+
+async def run(args):
+    try:
+        if args.command == "migrate":
+            await migrate(args)
+        else:
+            report = await benchmark(args)
+            text_report = json.dumps(report, indent=2, ensure_ascii=False)
+            print(text_report)
+            if args.output:
+                with open(args.output, "w", encoding="utf-8") as f:
+                    f.write(text_report)
+    finally:
+        await main.engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
@@ -0,0 +1,84 @@
+import asyncio
+import time
+
+from sqlalchemy import bindparam, func, or_, select, update
+
+from ingest import content_hash
+
+# 增量重新向量化：
+# 只处理 "内容变了" (content_hash 和 raw_content 对不上) 或 "模型换了" (model_version 不是当前模型) 的行，
+# 按主键顺序分批，一批一个事务。处理过的行不再满足条件，所以任务中途被打断后直接重跑即可从剩下的行继续；
+# 也可以用 start_after 跳过已经确认处理完的主键范围。
+
+
+def stale_condition(table, model_version: str):
+    """需要重新向量化的行：模型版本不同，或者内容哈希缺失/和当前内容不一致"""
+    current_hash = func.encode(func.sha256(func.convert_to(table.c.raw_content, "UTF8")), "hex")
+    return or_(
+        table.c.model_version.is_distinct_from(model_version),
+        table.c.content_hash.is_distinct_from(current_hash),
+    )
+
+
+async def reembed_stale(processor, session_factory, table, batch_size: int = 256, start_after: int = 0) -> int:
+    """
+    重新向量化过期的行，返回处理的行数
+    processor: 提供 get_embeddings(texts)、segment_for_index(texts) 和 model_version 的 NLP 处理器
+    table: 目标表 (例如 KnowledgeBase.__table__)
+    """
+    stale = stale_condition(table, processor.model_version)
+    # 不在 SET 里写 id，只用它定位行；其余的键 (embedding 等) 自动成为 SET 子句
+    stmt = update(table).where(table.c.id == bindparam("row_id"))
+    last_id, updated = start_after, 0
+    started = time.perf_counter()
+
+    while True:
+        async with session_factory() as session:
+            rows = (await session.execute(
+                select(table.c.id, table.c.raw_content)
+                .where(table.c.id > last_id, stale)
+                .order_by(table.c.id)
+                .limit(batch_size)
+            )).all()
+        if not rows:
+            break
+
+        texts = [row.raw_content for row in rows]
+        vectors = await asyncio.to_thread(processor.get_embeddings, texts)
+        segmented = await asyncio.to_thread(processor.segment_for_index, texts)
+
+        async with session_factory() as session:
+            async with session.begin():
+                await session.execute(stmt, [
+                    {
+                        "row_id": row.id,
+                        "embedding": vector,
+                        "segmented_content": tokens,
+                        "content_hash": content_hash(row.raw_content),
+                        "model_version": processor.model_version,
+                    }
+                    for row, vector, tokens in zip(rows, vectors, segmented)
+                ])
+
+        last_id = rows[-1].id
+        updated += len(rows)
+        elapsed = time.perf_counter() - started
+        print(f"   🔁 Re-embedded {updated} rows up to id={last_id} ({updated / elapsed:.0f} rows/s)")
+    return updated
+
+
+if __name__ == "__main__":
+    import sys
+
+    import main
+
+    async def _reembed(start_after):
+        main.nlp_processor = main.ChineseNLPProcessor()
+        await main.init_db()
+        count = await reembed_stale(
+            main.nlp_processor, main.AsyncSessionLocal, main.KnowledgeBase.__table__, start_after=start_after,
+        )
+        print(f"✅ Re-embedded {count} stale rows (model_version={main.nlp_processor.model_version})")
+        await main.engine.dispose()
+
+    asyncio.run(_reembed(int(sys.argv[1]) if len(sys.argv) > 1 else 0))
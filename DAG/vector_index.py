@@ -0,0 +1,179 @@
+import math
+from typing import Optional
+
+from pgvector.sqlalchemy import BIT, HALFVEC, Vector
+from sqlalchemy import cast, func, literal, text
+from sqlalchemy.sql import ClauseElement
+
+# pgvector 的 ANN (近似最近邻) 索引管理：
+# 没有索引时 ORDER BY l2_distance LIMIT k 是全表扫描，行数越多越慢；
+# 有了 HNSW / IVFFlat 索引后，查询只访问一小部分向量，延迟基本不随表大小增长。
+#
+# 注意：索引的距离类型必须和查询里用的距离函数一致，否则 PostgreSQL 不会用这个索引。
+
+# 距离类型 -> (索引 operator class, SQLAlchemy 比较方法名)
+DISTANCES = {
+    "l2": ("vector_l2_ops", "l2_distance"),
+    "cosine": ("vector_cosine_ops", "cosine_distance"),
+    "ip": ("vector_ip_ops", "max_inner_product"),
+}
+METHODS = ("hnsw", "ivfflat")
+
+# 索引里向量的存储表示 (表里始终保留 float32 原始向量，用来对候选做精确重排序)：
+#   vector   float32，4 字节/维
+#   halfvec  半精度，2 字节/维，索引大小减半，召回几乎不变
+#   binary   二值量化 (binary_quantize：每维 > 0 记 1)，1 bit/维，索引缩小 32 倍，
+#            Hamming 距离只适合粗排，必须重排序
+# 用的是表达式索引，所以切换表示不需要改表结构，也不需要重写已有的行。
+STORAGES = ("vector", "halfvec", "binary")
+
+
+def distance_expr(column, distance: str = "l2"):
+    """返回和索引匹配的距离表达式，例如 column.l2_distance(query_vec)"""
+    return getattr(column, DISTANCES[distance][1])
+
+
+def index_name(table: str, column: str, method: str, distance: str, storage: str = "vector") -> str:
+    if storage == "vector":
+        return f"ix_{table}_{column}_{method}_{distance}"
+    if storage == "binary":
+        distance = "hamming"
+    return f"ix_{table}_{column}_{storage}_{method}_{distance}"
+
+
+def storage_sql(column: str, storage: str, dim: int) -> str:
+    """索引表达式 (查询里的 quantized_distance 必须生成同样的表达式，PostgreSQL 才会用这个索引)"""
+    if storage == "halfvec":
+        return f"({column}::halfvec({dim}))"
+    if storage == "binary":
+        return f"(binary_quantize({column})::bit({dim}))"
+    return column
+
+
+def storage_ops(storage: str, distance: str) -> str:
+    if storage == "halfvec":
+        return DISTANCES[distance][0].replace("vector_", "halfvec_")
+    if storage == "binary":
+        return "bit_hamming_ops"
+    return DISTANCES[distance][0]
+
+
+def quantized_distance(column, query, storage: str, distance: str, dim: int):
+    """
+    在某种存储表示下，column 到 query 的距离表达式 (和 storage_sql 建的索引匹配)
+    query: 向量 (list / ndarray) 或 SQL 表达式
+    """
+    if storage == "vector":
+        return distance_expr(column, distance)(query)
+    if not isinstance(query, ClauseElement):
+        # 显式转成 vector：binary_quantize 有 vector / halfvec 两个重载，未知类型的参数会报歧义
+        query = cast(literal(query, Vector(dim)), Vector(dim))
+    if storage == "halfvec":
+        return getattr(cast(column, HALFVEC(dim)), DISTANCES[distance][1])(cast(query, HALFVEC(dim)))
+    if storage == "binary":
+        return cast(func.binary_quantize(column), BIT(dim)).hamming_distance(
+            cast(func.binary_quantize(query), BIT(dim))
+        )
+    raise ValueError(f"Unknown storage: {storage}")
+
+
+async def create_vector_index(
+    conn,
+    table: str,
+    column: str,
+    method: str = "hnsw",
+    distance: str = "l2",
+    m: int = 16,
+    ef_construction: int = 64,
+    lists: int = 0,
+    maintenance_work_mem: Optional[str] = "512MB",
+    storage: str = "vector",
+    dim: int = 0,
+) -> str:
+    """
+    在向量列上建 ANN 索引，返回索引名
+    同名索引已存在且参数相同时跳过；参数不同 (例如调整了 m / ef_construction / lists) 时删掉重建
+    建议在批量导入之后调用：先导入再建索引，比边插入边维护索引快得多
+
+    hnsw:    m = 每个节点的邻居数，ef_construction = 建图时的候选集大小 (越大召回越高，建得越慢)
+    ivfflat: lists = 聚类中心数，0 表示按行数自动选择 (pgvector 推荐: 100 万行以内 rows/1000，以上 sqrt(rows))
+    storage: vector / halfvec / binary (后两种需要传 dim，即向量维度)
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown index method: {method}")
+    if storage not in STORAGES:
+        raise ValueError(f"Unknown storage: {storage}")
+    ops = storage_ops(storage, distance)
+    name = index_name(table, column, method, distance, storage)
+
+    existing = await index_options(conn, name)
+    if method == "hnsw":
+        wanted = {"m": str(int(m)), "ef_construction": str(int(ef_construction))}
+    elif lists > 0:
+        wanted = {"lists": str(int(lists))}
+    else:
+        # 自动选择的 lists 随行数变化，已有索引就沿用，不因为行数变了而重建
+        wanted = existing
+        if wanted is None:
+            # IVFFlat 的聚类中心是在建索引时根据已有数据算出来的，所以必须在导入数据之后建
+            rows = (await conn.execute(text(f"SELECT count(*) FROM {table}"))).scalar_one()
+            lists = max(rows // 1000, 10) if rows <= 1_000_000 else int(math.sqrt(rows))
+            wanted = {"lists": str(lists)}
+    params = ", ".join(f"{key} = {value}" for key, value in wanted.items())
+
+    if existing is not None:
+        if existing == wanted:
+            print(f"   🗂️ Vector index ready: {name} ({params})")
+            return name
+        # 参数变了 (例如调整了 HNSW_M)：CREATE INDEX IF NOT EXISTS 不会生效，只能删掉重建
+        print(f"   ♻️ Rebuilding {name}: {existing} -> {wanted}")
+        await conn.execute(text(f"DROP INDEX {name}"))
+
+    if maintenance_work_mem:
+        # 建索引时给足内存，HNSW 的图能放进内存时建得快很多 (只对当前事务生效)
+        await conn.execute(text(f"SET LOCAL maintenance_work_mem = '{maintenance_work_mem}'"))
+    await conn.execute(text(
+        f"CREATE INDEX IF NOT EXISTS {name} ON {table} USING {method} ({storage_sql(column, storage, dim)} {ops}) "
+        f"WITH ({params})"
+    ))
+    print(f"   🗂️ Vector index ready: {name} ({params})")
+    return name
+
+
+async def index_options(conn, name: str) -> Optional[dict]:
+    """已有索引的 WITH 参数 (pg_class.reloptions，例如 {"m": "16", "ef_construction": "64"})，索引不存在时返回 None"""
+    row = (await conn.execute(
+        text("SELECT reloptions FROM pg_class WHERE relname = :name AND relkind = 'i'"), {"name": name}
+    )).first()
+    if row is None:
+        return None
+    return dict(option.split("=", 1) for option in row[0] or [])
+
+
+async def drop_vector_indexes(conn, table: str, column: str) -> None:
+    """删除这一列上所有由 create_vector_index 建的索引 (例如批量重新导入前)"""
+    for storage in STORAGES:
+        for method in METHODS:
+            for distance in DISTANCES:
+                await conn.execute(text(f"DROP INDEX IF EXISTS {index_name(table, column, method, distance, storage)}"))
+
+
+# pgvector 的 hnsw.ef_search 默认值
+DEFAULT_EF_SEARCH = 40
+
+
+async def set_search_params(session, ef_search: Optional[int] = None, probes: Optional[int] = None,
+                            min_rows: int = 0) -> None:
+    """
+    单次查询的召回率/速度旋钮 (SET LOCAL：只对当前事务生效，不影响连接池里的其他查询)
+    ef_search: HNSW 搜索时的候选集大小，默认 40，必须 >= LIMIT；越大召回越高、越慢
+    probes:    IVFFlat 搜索的聚类数，默认 1；越大召回越高、越慢
+    min_rows:  每个查询要从索引里取多少行：HNSW 扫描最多只返回 ef_search 行，所以 ef_search 至少提到这个值
+               (否则 LIMIT 100 只会悄悄拿到 40 行)
+    """
+    if ef_search is not None or min_rows > DEFAULT_EF_SEARCH:
+        ef_search = max(ef_search or 0, min_rows)
+    if ef_search is not None:
+        await session.execute(text(f"SET LOCAL hnsw.ef_search = {int(ef_search)}"))
+    if probes is not None:
+        await session.execute(text(f"SET LOCAL ivfflat.probes = {int(probes)}"))
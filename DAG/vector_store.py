@@ -0,0 +1,227 @@
+import json
+import os
+from abc import ABC, abstractmethod
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+# 可插拔的向量存储：
+#   VectorStore      抽象接口 (add / search / len)，pgvector 之外的实现都按这个接口写
+#   NumpyVectorStore 进程内实现：连续的 float32 矩阵 (可选 memmap 落盘)，一次矩阵乘法算完整批查询的距离，
+#                    argpartition 取 top-k。适合作为 PostgreSQL 前面的低延迟缓存层，也可以在没有数据库时测试检索效果。
+# 距离的定义和 pgvector 保持一致 (值越小越相似)：
+#   l2 = 欧氏距离, cosine = 1 - 余弦相似度, ip = -内积 (pgvector 的 <#> 运算符)
+
+SearchResult = Tuple[np.ndarray, np.ndarray]  # (ids, distances)，每个查询一行
+
+
+class VectorStore(ABC):
+    """向量存储接口：ids 是调用方的主键 (例如 knowledge_base.id)"""
+
+    dim: int
+
+    @abstractmethod
+    def add(self, ids: Sequence[int], vectors) -> None:
+        """追加一批向量"""
+
+    @abstractmethod
+    def search(self, queries, k: int = 10) -> SearchResult:
+        """批量查询：queries 形状 (Q, dim) 或 (dim,)，返回形状 (Q, k) 的 ids 和距离 (按距离从小到大)"""
+
+    @abstractmethod
+    def __len__(self) -> int:
+        ...
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    NumPy 向量存储
+    path 为空：纯内存；否则数据存在 path 目录下 (vectors.npy / ids.npy 以 memmap 打开，meta.json 记录条数)，
+    进程重启后直接映射回来，不需要重新读取到内存。
+    version: 向量的版本 (例如 embedding 模型版本)，和落盘的版本不一致时丢弃旧数据重新开始；
+    meta.json 还记录已加载的最大 id (max_id)，调用方只需要补充 id 更大的新行；
+    fingerprint 是调用方给已加载的行算的指纹 (例如 id + content_hash 的哈希)，用来发现行被原地更新或删除，
+    指纹对不上时调用 reset() 清空重建。
+    容量按 2 倍扩展，追加是均摊 O(1) 的。
+    """
+
+    def __init__(self, dim: int, distance: str = "l2", path: Optional[str] = None,
+                 capacity: int = 1024, query_block: int = 256, version: Optional[str] = None):
+        if distance not in ("l2", "cosine", "ip"):
+            raise ValueError(f"Unknown distance: {distance}")
+        self.dim = dim
+        self.distance = distance
+        self.path = path
+        self.query_block = query_block  # 每次矩阵乘法最多处理多少个查询，限制 (Q, N) 距离矩阵的内存
+        self.version = version
+        self._count = 0
+        self._max_id = None
+        self.fingerprint = None
+
+        if not (path and os.path.exists(os.path.join(path, "meta.json")) and self._open(path)):
+            self._vectors, self._ids = self._allocate(max(capacity, 1))
+        # l2 距离展开成 |q|² - 2 q·x + |x|²，|x|² 预先算好
+        self._sq_norms = np.einsum("ij,ij->i", self._vectors[:self._count], self._vectors[:self._count])
+
+    # ---- 存储 ----
+
+    def _allocate(self, capacity: int):
+        if not self.path:
+            return np.zeros((capacity, self.dim), dtype=np.float32), np.zeros(capacity, dtype=np.int64)
+        os.makedirs(self.path, exist_ok=True)
+        vectors = np.lib.format.open_memmap(
+            os.path.join(self.path, "vectors.tmp.npy"), mode="w+", dtype=np.float32, shape=(capacity, self.dim)
+        )
+        ids = np.lib.format.open_memmap(
+            os.path.join(self.path, "ids.tmp.npy"), mode="w+", dtype=np.int64, shape=(capacity,)
+        )
+        return vectors, ids
+
+    def _open(self, path: str) -> bool:
+        """打开已落盘的存储；版本不一致时删掉 meta.json 并返回 False (由调用方重新分配)"""
+        meta_path = os.path.join(path, "meta.json")
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta["dim"] != self.dim or meta["distance"] != self.distance:
+            raise ValueError(f"Store at {path} was built with dim={meta['dim']}, distance={meta['distance']}")
+        if meta.get("version") != self.version:
+            # 旧版本的向量和新模型的查询向量不在同一个空间，整份重建
+            print(f"♻️ Store at {path} has version {meta.get('version')!r}, expected {self.version!r}; rebuilding")
+            os.remove(meta_path)
+            return False
+        self._count = meta["count"]
+        self._vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r+")
+        self._ids = np.load(os.path.join(path, "ids.npy"), mmap_mode="r+")
+        self._max_id = meta.get("max_id")
+        self.fingerprint = meta.get("fingerprint")
+        if self._max_id is None and self._count:
+            self._max_id = int(self._ids[:self._count].max())
+        return True
+
+    def _grow(self, needed: int) -> None:
+        capacity = len(self._ids)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        vectors, ids = self._allocate(capacity)
+        vectors[:self._count] = self._vectors[:self._count]
+        ids[:self._count] = self._ids[:self._count]
+        self._vectors, self._ids = vectors, ids
+        if self.path:
+            self._commit_files()
+
+    def _commit_files(self) -> None:
+        """memmap 模式下，把新分配的文件换成正式文件 (rename 是原子的)"""
+        for name in ("vectors", "ids"):
+            tmp = os.path.join(self.path, f"{name}.tmp.npy")
+            if os.path.exists(tmp):
+                os.replace(tmp, os.path.join(self.path, f"{name}.npy"))
+
+    def flush(self) -> None:
+        """把 memmap 的修改和条数写回磁盘 (纯内存模式下什么都不做)"""
+        if not self.path:
+            return
+        self._commit_files()
+        self._vectors.flush()
+        self._ids.flush()
+        with open(os.path.join(self.path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "distance": self.distance, "count": self._count,
+                       "version": self.version, "max_id": self._max_id, "fingerprint": self.fingerprint}, f)
+
+    def reset(self) -> None:
+        """清空所有向量 (容量保留)，之后重新 add；落盘的文件在下一次 flush 时覆盖"""
+        self._count = 0
+        self._max_id = None
+        self.fingerprint = None
+        self._sq_norms = np.zeros(0, dtype=self._sq_norms.dtype)
+
+    # ---- 写入 / 查询 ----
+
+    def _prepare(self, vectors) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors[None, :]
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected vectors of dim {self.dim}, got {vectors.shape[1]}")
+        if self.distance == "cosine":
+            # 余弦距离：存之前先归一化，查询时只需要一次内积
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.maximum(norms, 1e-12)
+        return vectors
+
+    def add(self, ids: Sequence[int], vectors) -> None:
+        vectors = self._prepare(vectors)
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(ids) != len(vectors):
+            raise ValueError("ids and vectors must have the same length")
+        start, end = self._count, self._count + len(ids)
+        self._grow(end)
+        self._vectors[start:end] = vectors
+        self._ids[start:end] = ids
+        self._sq_norms = np.concatenate([self._sq_norms, np.einsum("ij,ij->i", vectors, vectors)])
+        self._count = end
+        if len(ids):
+            batch_max = int(ids.max())
+            self._max_id = batch_max if self._max_id is None else max(self._max_id, batch_max)
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def max_id(self) -> Optional[int]:
+        """已加载的最大 id (空存储时为 None)"""
+        return self._max_id
+
+    def _distances(self, queries: np.ndarray, matrix: np.ndarray) -> np.ndarray:
+        scores = queries @ matrix.T  # (Q, N)，整个查询块一次 BLAS 调用
+        if self.distance == "l2":
+            sq = np.einsum("ij,ij->i", queries, queries)[:, None] - 2 * scores + self._sq_norms[None, :]
+            return np.sqrt(np.maximum(sq, 0, out=sq), out=sq)
+        if self.distance == "cosine":
+            return 1 - scores
+        return -scores
+
+    def search(self, queries, k: int = 10) -> SearchResult:
+        queries = self._prepare(queries)
+        k = min(k, self._count)
+        ids = np.empty((len(queries), k), dtype=np.int64)
+        distances = np.empty((len(queries), k), dtype=np.float32)
+        if k == 0:
+            return ids, distances
+
+        matrix = self._vectors[:self._count]
+        for start in range(0, len(queries), self.query_block):
+            block = self._distances(queries[start:start + self.query_block], matrix)
+            # argpartition 只保证前 k 个是最小的 k 个 (O(N))，再只对这 k 个排序
+            if k < block.shape[1]:
+                top = np.argpartition(block, k - 1, axis=1)[:, :k]
+            else:
+                top = np.broadcast_to(np.arange(block.shape[1]), block.shape).copy()
+            top_dist = np.take_along_axis(block, top, axis=1)
+            order = np.argsort(top_dist, axis=1)
+            top = np.take_along_axis(top, order, axis=1)
+            ids[start:start + len(block)] = self._ids[top]
+            distances[start:start + len(block)] = np.take_along_axis(top_dist, order, axis=1)
+        return ids, distances
+
+
+async def load_from_table(session, id_column, vector_column, store: VectorStore, chunk_size: int = 10000,
+                          start_after: Optional[int] = None) -> int:
+    """
+    把数据库表里的向量流式灌进 store (服务启动时预热缓存层用)，返回条数
+    用 stream 分批读取，不会一次性把整张表读进内存
+    start_after: 只读 id 大于它的行 (增量补充已落盘的存储)
+    """
+    from sqlalchemy import select
+
+    stmt = select(id_column, vector_column)
+    if start_after is not None:
+        stmt = stmt.where(id_column > start_after)
+    result = await session.stream(stmt.execution_options(yield_per=chunk_size))
+    loaded = 0
+    async for rows in result.partitions():
+        ids = [row[0] for row in rows]
+        store.add(ids, np.stack([np.asarray(row[1], dtype=np.float32) for row in rows]))
+        loaded += len(ids)
+    return loaded
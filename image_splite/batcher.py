@@ -0,0 +1,149 @@
+import asyncio
+import time
+
+import torch
+
+from executor import ServerBusy, StageExecutor
+from preimage import new_batch_buffer, normalize_into, to_device
+
+
+def run_model(model, inputs):
+    """
+    对一个批次做前向传播，返回 (预测类别下标列表, 置信度列表)
+    argmax / softmax 也在整个批次上一次算完，避免每张图片单独调用 torch
+    """
+    with torch.no_grad():
+        pred = model(inputs)
+        confidences, indices = pred.softmax(1).max(1)
+    return indices.tolist(), confidences.tolist()
+
+
+class MicroBatcher:
+    """
+    动态微批处理 (Dynamic Micro-Batching)：
+    把并发到达的多张图片拼成一个 [N, 1, 28, 28] 的批次，只做一次前向传播，
+    再把每张图片的结果分发回各自等待的请求。
+    每个推理线程有一块预先分配的批次缓冲区，图片直接归一化写进去，模型拿到的是缓冲区的切片 (不复制)。
+    """
+
+    def __init__(self, model, max_batch_size=32, max_wait_ms=5.0, executor=None, max_queue=256):
+        self.model = model
+        self.max_batch_size = max_batch_size   # 一个批次最多放多少张图片
+        self.max_wait = max_wait_ms / 1000     # 第一张图片最多等多久 (秒)，用来控制 p99 延迟
+        self.executor = executor or StageExecutor("infer", workers=1)  # 推理用的线程池
+        self.max_queue = max_queue             # 最多允许多少张图片排队，超过直接返回 503
+        self._queue = None
+        self._worker = None
+        self._slots = None
+        self._buffers = []
+        self._tasks = set()  # 正在跑的批次；事件循环只保留任务的弱引用，要自己持有，否则可能被垃圾回收
+
+    async def start(self):
+        """在事件循环里启动后台凑批任务 (应用启动时调用)"""
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        # 同时在跑的批次数 = 推理线程数：一个批次在算的时候，下一个批次可以继续凑
+        self._slots = asyncio.Semaphore(self.executor.workers)
+        self._buffers = [new_batch_buffer(self.max_batch_size) for _ in range(self.executor.workers)]
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止后台任务，并让还在排队的请求失败返回 (应用关闭时调用)"""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+        # 已经开始的批次让它们算完，等待中的请求正常拿到结果
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+        while self._queue is not None and not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("推理服务正在关闭"))
+
+    async def submit(self, image):
+        """
+        提交一张解码好的图片 ([28, 28] uint8)，等待批处理完成后返回
+        (预测类别下标, 置信度, 这个批次的推理耗时秒数)
+        """
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((image, future))
+        except asyncio.QueueFull:
+            raise ServerBusy(f"推理队列已满 ({self.max_queue})，请稍后重试")
+        return await future
+
+    async def _collect(self):
+        """凑一个批次：拿到第一张后，最多再等 max_wait 秒或凑满 max_batch_size"""
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            # 已经在排队的直接拿走，不用等
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            # 没有空闲的推理线程时先不凑批，让请求在队列里继续积累成更大的批次
+            await self._slots.acquire()
+            batch = await self._collect()
+            task = asyncio.create_task(self._dispatch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._task_done)
+
+    def _task_done(self, task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"⚠️ 批处理任务异常: {task.exception()!r}")
+
+    def _prepare(self, buffer, batch):
+        """把一批 uint8 图片反转+归一化，直接写进预分配的缓冲区，返回缓冲区前 N 行的视图"""
+        rows = buffer.numpy()[:, 0]
+        for i, (image, _) in enumerate(batch):
+            normalize_into(image, rows[i])
+        return to_device(buffer[:len(batch)])
+
+    def _forward(self, buffer, batch):
+        started = time.perf_counter()
+        indices, confidences = run_model(self.model, self._prepare(buffer, batch))
+        return indices, confidences, time.perf_counter() - started
+
+    async def _dispatch(self, batch):
+        # 占用一块缓冲区：同时在跑的批次数不超过缓冲区数量 (由 _slots 保证)
+        buffer = self._buffers.pop()
+        try:
+            # 客户端断开时 future 会被取消，这些图片就不用算了
+            batch = [(image, future) for image, future in batch if not future.done()]
+            if not batch:
+                return
+
+            try:
+                # 归一化和前向传播都是 CPU 密集型的，放到推理线程池里跑，不阻塞事件循环
+                indices, confidences, elapsed = await self.executor.run(self._forward, buffer, batch)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+
+            for (_, future), index, confidence in zip(batch, indices, confidences):
+                if not future.done():
+                    future.set_result((index, confidence, elapsed))
+        finally:
+            self._buffers.append(buffer)
+            self._slots.release()
@@ -0,0 +1,173 @@
+"""
+image_splite 服务的压测脚本 (离线可跑，不需要外网)
+
+把 FashionMNIST 测试集图片编码成 PNG/JPEG，按指定并发数重放给 /predict，
+统计吞吐量、p50/p95/p99 延迟，以及服务端通过 Server-Timing 返回的各阶段耗时
+(parse: multipart 解析, read: 读取上传内容, decode: 解码缩放, queue: 排队凑批, forward: 推理, serialize: 序列化)。
+结果以 JSON 输出，方便不同版本之间 diff。
+
+用法 (在 image_splite 目录下)：
+    python benchmark.py                                  # 在进程内启动 app (ASGI 客户端)
+    python benchmark.py --url http://127.0.0.1:8000      # 压测已经启动的 uvicorn
+    python benchmark.py --concurrency 64 --format jpeg --size 224 --output bench.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import time
+
+import cv2
+import httpx
+import numpy as np
+
+from fast_data import MmapFashionMNIST
+
+# 影响性能的服务端配置，一起写进结果里，方便对比
+_SERVICE_ENV = (
+    "MODEL_VARIANT", "MAX_BATCH_SIZE", "MAX_WAIT_MS", "INFER_WORKERS",
+    "DECODE_WORKERS", "DECODE_USE_PROCESSES",
+)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="image_splite /predict 压测")
+    parser.add_argument("--url", default=None, help="服务地址；不填则在进程内启动 main.app")
+    parser.add_argument("--requests", type=int, default=2000, help="正式压测的请求数")
+    parser.add_argument("--warmup", type=int, default=100, help="预热请求数 (不计入结果)")
+    parser.add_argument("--concurrency", type=int, default=16, help="同时在途的请求数")
+    parser.add_argument("--format", choices=["png", "jpeg"], default="png")
+    parser.add_argument("--size", type=int, default=28, help="把图片放大到 size x size 再编码，模拟真实上传")
+    parser.add_argument("--output", default=None, help="结果 JSON 的保存路径 (默认只打印)")
+    return parser.parse_args()
+
+
+def encode_images(count, fmt, size):
+    """
+    取测试集前 count 张图片 (固定顺序，保证可复现)，编码成上传用的字节流
+    FashionMNIST 是黑底白物，服务端会做颜色反转，所以这里先反转成 "白底黑物" 的真实照片风格
+    """
+    images = MmapFashionMNIST(train=False).images
+    ext = ".png" if fmt == "png" else ".jpg"
+    encoded = []
+    for i in range(count):
+        img = 255 - np.asarray(images[i % len(images)])
+        if size != 28:
+            img = cv2.resize(img, (size, size), interpolation=cv2.INTER_LINEAR)
+        ok, buf = cv2.imencode(ext, img)
+        if not ok:
+            raise RuntimeError(f"图片编码失败: {i}")
+        encoded.append(buf.tobytes())
+    return encoded
+
+
+def parse_server_timing(header):
+    """'decode;dur=1.2, forward;dur=0.3' -> {'decode': 1.2, 'forward': 0.3} (毫秒)"""
+    stages = {}
+    for part in header.split(","):
+        name, _, dur = part.strip().partition(";dur=")
+        if name and dur:
+            stages[name] = float(dur)
+    return stages
+
+
+async def run_load(client, payloads, concurrency, ext):
+    """固定并发数重放请求，返回每个请求的 (状态码, 延迟毫秒, 服务端阶段耗时)"""
+    results = []
+    next_index = 0
+
+    async def worker():
+        nonlocal next_index
+        while next_index < len(payloads):
+            i = next_index
+            next_index += 1
+            files = {"file": (f"{i}{ext}", payloads[i], "image/png" if ext == ".png" else "image/jpeg")}
+            started = time.perf_counter()
+            try:
+                response = await client.post("/predict", files=files)
+                status = response.status_code
+                stages = parse_server_timing(response.headers.get("server-timing", ""))
+            except httpx.HTTPError:
+                status, stages = 0, {}
+            results.append((status, (time.perf_counter() - started) * 1000, stages))
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return results
+
+
+def _percentiles(values):
+    if not values:
+        return {}
+    values = np.asarray(values)
+    return {
+        "mean": float(values.mean()),
+        "p50": float(np.percentile(values, 50)),
+        "p95": float(np.percentile(values, 95)),
+        "p99": float(np.percentile(values, 99)),
+    }
+
+
+def summarize(results, elapsed):
+    ok = [r for r in results if r[0] == 200]
+    latencies = [latency for _, latency, _ in ok]
+
+    stage_names = sorted({name for _, _, stages in ok for name in stages})
+    stages = {name: _percentiles([s[name] for _, _, s in ok if name in s]) for name in stage_names}
+    # 客户端看到的总延迟里，服务端各阶段以外的部分 (网络/ASGI/HTTP 客户端开销)
+    stages["client_overhead"] = _percentiles([latency - sum(s.values()) for _, latency, s in ok if s])
+
+    return {
+        "requests": len(results),
+        "succeeded": len(ok),
+        "errors": {str(code): sum(1 for r in results if r[0] == code) for code in {r[0] for r in results if r[0] != 200}},
+        "elapsed_seconds": elapsed,
+        "throughput_rps": len(ok) / elapsed if elapsed > 0 else 0.0,
+        "latency_ms": _percentiles(latencies),
+        "stages_ms": stages,
+    }
+
+
+async def benchmark(args):
+    ext = ".png" if args.format == "png" else ".jpg"
+    payloads = encode_images(args.warmup + args.requests, args.format, args.size)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    async def measure(client):
+        await run_load(client, payloads[:args.warmup], args.concurrency, ext)
+        started = time.perf_counter()
+        results = await run_load(client, payloads[args.warmup:], args.concurrency, ext)
+        return summarize(results, time.perf_counter() - started)
+
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60) as client:
+            return await measure(client)
+
+    # 进程内压测：直接导入 app，并手动执行 lifespan (ASGITransport 不会触发启动/关闭事件)
+    import main
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=60) as client:
+            return await measure(client)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    summary = asyncio.run(benchmark(args))
+    report = {
+        "config": {
+            **vars(args),
+            "mode": "http" if args.url else "in-process",
+            "service_env": {name: os.environ[name] for name in _SERVICE_ENV if name in os.environ},
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+        },
+        **summary,
+    }
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
@@ -0,0 +1,54 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+
+class ServerBusy(Exception):
+    """排队的任务太多了，直接拒绝 (由 main.py 转换成 HTTP 503)，而不是让延迟无限上涨"""
+
+
+class StageExecutor:
+    """
+    把一个处理阶段 (解码 / 推理) 放到独立的线程池或进程池里执行，
+    这样事件循环不会被 CPU 密集型任务卡住，不同请求的解码和推理也可以重叠进行。
+    """
+
+    def __init__(self, name, workers=4, use_processes=False, max_pending=64):
+        self.name = name
+        self.workers = workers
+        self.max_pending = max_pending  # 允许同时排队+执行的任务上限
+        self._pending = 0
+        if use_processes:
+            # 进程池可以绕开 GIL，但参数和结果要在进程间序列化，只适合解码这类纯 numpy 的任务
+            self.pool = ProcessPoolExecutor(max_workers=workers)
+        else:
+            self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def _reserve(self, count):
+        if self._pending + count > self.max_pending:
+            raise ServerBusy(f"{self.name} 队列已满 ({self._pending}/{self.max_pending})，请稍后重试")
+        self._pending += count
+
+    async def run(self, fn, *args):
+        """在池里执行 fn(*args)，队列满时抛出 ServerBusy"""
+        self._reserve(1)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.pool, fn, *args)
+        finally:
+            self._pending -= 1
+
+    async def map(self, fn, items):
+        """把一组任务一起提交 (整组占用队列名额)，按顺序返回结果"""
+        items = list(items)
+        self._reserve(len(items))
+        loop = asyncio.get_running_loop()
+        try:
+            return await asyncio.gather(*(loop.run_in_executor(self.pool, fn, item) for item in items))
+        finally:
+            self._pending -= len(items)
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,132 @@
+import os
+
+import numpy as np
+import torch
+
+# idx 文件头里的数据类型编码 (FashionMNIST 只用到 0x08 = uint8)
+_IDX_DTYPES = {0x08: np.uint8}
+
+
+def read_idx(path):
+    """
+    把 idx-ubyte 文件 memory-map 成 numpy 数组 (不读入内存，用到哪页才读哪页)
+    文件格式：2 字节 0 + 1 字节数据类型 + 1 字节维数，然后每一维一个大端 int32，最后是数据
+    """
+    with open(path, "rb") as f:
+        header = f.read(4)
+        if header[:2] != b"\x00\x00" or header[2] not in _IDX_DTYPES:
+            raise ValueError(f"{path} 不是 uint8 的 idx 文件")
+        ndim = header[3]
+        shape = tuple(int.from_bytes(f.read(4), "big") for _ in range(ndim))
+    # mode="c" (copy-on-write)：数组可写，避免 torch.from_numpy 警告，但永远不会写回文件
+    return np.memmap(path, dtype=_IDX_DTYPES[header[2]], mode="c", offset=4 + 4 * ndim, shape=shape)
+
+
+def ensure_downloaded(root="data"):
+    """原始 idx 文件不存在时，借用 torchvision 下载一次 (之后就不再需要 torchvision)"""
+    raw = os.path.join(root, "FashionMNIST", "raw")
+    if not os.path.exists(os.path.join(raw, "train-images-idx3-ubyte")):
+        from torchvision import datasets
+        datasets.FashionMNIST(root=root, train=True, download=True)
+        datasets.FashionMNIST(root=root, train=False, download=True)
+    return raw
+
+
+class MmapFashionMNIST:
+    """
+    直接 memory-map data/FashionMNIST/raw 里的原始文件：
+    images 是 [N, 28, 28] uint8 的 memmap 视图，labels 是 int64 Tensor (只有几十 KB，直接读入内存)
+    """
+
+    def __init__(self, root="data", train=True):
+        raw = ensure_downloaded(root)
+        prefix = "train" if train else "t10k"
+        self.image_path = os.path.join(raw, f"{prefix}-images-idx3-ubyte")
+        self.label_path = os.path.join(raw, f"{prefix}-labels-idx1-ubyte")
+        self._open()
+
+    def _open(self):
+        self.images = read_idx(self.image_path)
+        self.labels = torch.from_numpy(read_idx(self.label_path).astype(np.int64))
+
+    def __getstate__(self):
+        # 传给 DataLoader 子进程时只传文件路径，子进程自己重新 memory-map，不把整份数据序列化过去
+        return {"image_path": self.image_path, "label_path": self.label_path}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._open()
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getitem__(self, index):
+        return to_float_batch(self.images[index:index + 1])[0], self.labels[index]
+
+    def __getitems__(self, indices):
+        """
+        DataLoader 的批量取数接口：一次取整个批次，配合 collate_batch 使用，
+        这样多进程 DataLoader 里每个 worker 也是整批向量化转换，而不是逐张取再拼接
+        """
+        batch_idx = np.sort(np.asarray(indices))
+        return to_float_batch(self.images[batch_idx]), self.labels[torch.from_numpy(batch_idx)]
+
+    def to_tensors(self):
+        """整个数据集一次性转成 ([N, 1, 28, 28] float32, [N] int64)，评估时用"""
+        return to_float_batch(self.images), self.labels
+
+
+def collate_batch(batch):
+    """__getitems__ 已经返回拼好的 (X, y)，DataLoader 不需要再合并"""
+    return batch
+
+
+def to_float_batch(images):
+    """[B, 28, 28] uint8 -> [B, 1, 28, 28] float32 (0~1)，整批一次向量化转换 (和 ToTensor 结果一致)"""
+    return torch.from_numpy(np.ascontiguousarray(images)).unsqueeze(1).float().div_(255)
+
+
+class FastBatchLoader:
+    """
+    DataLoader 的轻量替代：不再逐张 __getitem__ 走 PIL，而是按批次切片，
+    每个批次只做一次 uint8 -> float32 的转换。打乱顺序靠下标排列 (randperm) 实现。
+    """
+
+    def __init__(self, dataset, batch_size=64, shuffle=False, drop_last=False, seed=None):
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.generator = torch.Generator()
+        if seed is not None:
+            self.generator.manual_seed(seed)
+
+    def _indices(self):
+        """这一轮要遍历的样本下标；不打乱时返回 None，表示按顺序切片"""
+        if not self.shuffle:
+            return None
+        return torch.randperm(len(self.dataset), generator=self.generator).numpy()
+
+    def __len__(self):
+        n = len(self.dataset)
+        if self.drop_last:
+            return n // self.batch_size
+        return (n + self.batch_size - 1) // self.batch_size
+
+    def __iter__(self):
+        indices = self._indices()
+        n = len(self.dataset) if indices is None else len(indices)
+        end = n - n % self.batch_size if self.drop_last else n
+
+        for start in range(0, end, self.batch_size):
+            stop = min(start + self.batch_size, end)
+            if indices is None:
+                # 顺序读取：直接切片，拿到的是 memmap 的视图，不复制
+                images = self.dataset.images[start:stop]
+                labels = self.dataset.labels[start:stop]
+            else:
+                # 打乱读取：批次内按下标排序，读文件时更连续 (对 SGD 来说批次内顺序无所谓)
+                batch_idx = np.sort(indices[start:stop])
+                images = self.dataset.images[batch_idx]
+                labels = self.dataset.labels[torch.from_numpy(batch_idx)]
+            yield to_float_batch(images), labels
@@ -1,24 +1,33 @@
+import time
+
+# 记录进程开始导入的时间，用来统计冷启动耗时
+_import_started = time.perf_counter()
+
+import io
+import os
+import zipfile
+from contextlib import asynccontextmanager
+from typing import List
+
+import numpy as np
 import torch
-from torch import nn
-from torch.utils.data import DataLoader
-from torchvision import datasets
-from torchvision.transforms import ToTensor
 
 import model
-from model import test_data
-from fastapi import FastAPI, UploadFile, File
+from fastapi import FastAPI, UploadFile, File, Query, Request
+from fastapi.responses import JSONResponse
 import uvicorn
-import mlflow
 
-from preimage import transform_image
+from preimage import decode_image, to_tensor, transform_packed
+from batcher import MicroBatcher, run_model
+from executor import ServerBusy, StageExecutor
+from variants import load_variant
+from metrics import peak_rss_mb
 
-# 1. 设定 MLflow 实验 (Tracking)
-# 如果实验不存在，它会被创建
-experiment_name = "Image_Splite_Demo"
-mlflow.set_experiment(experiment_name) 
-
-# 1. 重新实例化一个"空脑子"的模型
-model_new = model.MyFashionModel()
+# 1. 服务端只导入 model.py 里的模型定义，不会创建数据集、DataLoader 或优化器
+# (MLflow 实验也只在训练脚本 train.py 里设置)，冷启动更快、占用内存更少，离线机器也能启动
+# 启动完成后会打印耗时和常驻内存 (RSS)，超过下面的目标值会给出警告
+STARTUP_TARGET_SECONDS = float(os.getenv("STARTUP_TARGET_SECONDS", "3"))
+STARTUP_TARGET_RSS_MB = float(os.getenv("STARTUP_TARGET_RSS_MB", "400"))
 
 # 2. 加载保存好的参数 (注入记忆)
 # map_location='cpu' 确保即使你在GPU上训练的，在没有GPU的电脑上也能加载
@@ -26,15 +35,52 @@ model_new = model.MyFashionModel()
 device = torch.accelerator.current_accelerator().type if torch.accelerator.is_available() else "cpu"
 print(f"Using {device} device")
 
+# MODEL_VARIANT 选择部署形态：eager / int8 / traced / int8_traced / compiled
+# 各形态的精度和延迟对比见 `python variants.py` 生成的 variant_report.json
+MODEL_VARIANT = os.getenv("MODEL_VARIANT", "eager")
+
 try:
-    model_new.load_state_dict(torch.load("model_weights.pth", map_location=device))
-    print("模型权重加载成功！")
+    model_new = load_variant(MODEL_VARIANT, "model_weights.pth", device)
+    print(f"模型权重加载成功！(variant: {MODEL_VARIANT})")
 except FileNotFoundError:
     print("⚠️ 警告：找不到 model_weights.pth，模型将使用随机参数（预测会不准）")
+    # 重新实例化一个"空脑子"的模型
+    model_new = model.MyFashionModel()
 # 3. 把模型搬到现在的设备上
 model_new.to(device)
 model_new.eval() # 切换到预测模式
 
+# 4. 解码和推理分别放到独立的线程池 (解码可选进程池)，不阻塞事件循环
+# 队列里的任务超过上限时直接返回 503，而不是让延迟无限上涨
+DECODE_WORKERS = int(os.getenv("DECODE_WORKERS", "4"))
+DECODE_USE_PROCESSES = os.getenv("DECODE_USE_PROCESSES", "0") == "1"
+MAX_PENDING_DECODES = int(os.getenv("MAX_PENDING_DECODES", "2048"))
+INFER_WORKERS = int(os.getenv("INFER_WORKERS", "1"))
+MAX_PENDING_BATCHES = int(os.getenv("MAX_PENDING_BATCHES", "16"))
+MAX_QUEUED_IMAGES = int(os.getenv("MAX_QUEUED_IMAGES", "256"))
+
+decode_executor = StageExecutor(
+    "decode", workers=DECODE_WORKERS, use_processes=DECODE_USE_PROCESSES, max_pending=MAX_PENDING_DECODES
+)
+infer_executor = StageExecutor("infer", workers=INFER_WORKERS, max_pending=MAX_PENDING_BATCHES)
+
+# 5. 动态微批处理：把并发请求合并成一个批次做推理
+# MAX_BATCH_SIZE: 一个批次最多多少张图片；MAX_WAIT_MS: 凑批最多等待多少毫秒 (决定增加的尾延迟上限)
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "32"))
+MAX_WAIT_MS = float(os.getenv("MAX_WAIT_MS", "5"))
+batcher = MicroBatcher(
+    model_new,
+    max_batch_size=MAX_BATCH_SIZE,
+    max_wait_ms=MAX_WAIT_MS,
+    executor=infer_executor,
+    max_queue=MAX_QUEUED_IMAGES,
+)
+
+# 6. /predict/batch 一次最多接受多少张图片 (防止一个请求占满内存)
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "1024"))
+# format=zip 时解压后的总大小上限 (MB)，在真正解压之前按压缩包目录里记录的大小检查
+BATCH_MAX_UNZIPPED_MB = float(os.getenv("BATCH_MAX_UNZIPPED_MB", "64"))
+
 
 #print("模型加载成功！")
 #image_path = 'src/1.jpg'
@@ -47,33 +93,177 @@ classes = [
     "T-shirt/top", "Trouser", "Pullover", "Dress", "Coat",
     "Sandal", "Shirt", "Sneaker", "Bag", "Ankle boot",
 ]
+def report_startup():
+    elapsed = time.perf_counter() - _import_started
+    rss = peak_rss_mb()
+    print(f"🚀 启动耗时 {elapsed:.2f}s (目标 {STARTUP_TARGET_SECONDS}s)"
+          + (f"，峰值内存 {rss:.0f}MB (目标 {STARTUP_TARGET_RSS_MB:.0f}MB)" if rss is not None else ""))
+    if elapsed > STARTUP_TARGET_SECONDS:
+        print("⚠️ 警告：启动耗时超过目标")
+    if rss is not None and rss > STARTUP_TARGET_RSS_MB:
+        print("⚠️ 警告：启动内存超过目标")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 启动时开启凑批后台任务，关闭时停止
+    await batcher.start()
+    report_startup()
+    yield
+    await batcher.stop()
+    decode_executor.shutdown()
+    infer_executor.shutdown()
+
+class RequestStartMiddleware:
+    """
+    纯 ASGI 中间件：在请求刚进来时记下时间，
+    这样 /predict 能算出 multipart 解析 (发生在进入路由函数之前) 花了多久
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            scope.setdefault("state", {})["started"] = time.perf_counter()
+        await self.app(scope, receive, send)
+
+
+def server_timing(stages):
+    """{阶段: 秒} -> Server-Timing 响应头 (单位毫秒)，压测脚本据此统计每个阶段的耗时"""
+    return ", ".join(f"{name};dur={seconds * 1000:.3f}" for name, seconds in stages.items())
+
+
 #创建 FastAPI 应用
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(RequestStartMiddleware)
 print("FastAPI 应用创建成功！")
+
+@app.exception_handler(ServerBusy)
+async def server_busy_handler(request: Request, exc: ServerBusy):
+    # 过载保护：告诉客户端稍后重试
+    return JSONResponse(status_code=503, content={"error": str(exc)}, headers={"Retry-After": "1"})
+
 @app.get("/")
 def home():
     return {"message": "欢迎使用 Fashion AI 识别服务！请访问 /docs 进行测试"}
 
 @app.post("/predict")
-async def predict(file: UploadFile = File(...)):
+async def predict(request: Request, file: UploadFile = File(...)):
+    # 各阶段耗时，最后通过 Server-Timing 响应头返回
+    stages = {}
+    mark = time.perf_counter()
+    started = getattr(request.state, "started", None)
+    if started is not None:
+        stages["parse"] = mark - started
+
     # 1. 读取上传的文件内容
     image_bytes = await file.read()
-    
-    # 2. 预处理图片
+    stages["read"], mark = time.perf_counter() - mark, time.perf_counter()
+
+    # 2. 预处理图片 (在解码线程池里执行，和其他请求的推理重叠)
+    # 这里只解码成 28x28 uint8，归一化由批处理器直接写进批次缓冲区
     try:
-        input_tensor = transform_image(image_bytes)
+        image = await decode_executor.run(decode_image, image_bytes)
+    except ServerBusy:
+        raise
     except Exception as e:
         return {"error": f"图片处理失败: {str(e)}"}
+    stages["decode"], mark = time.perf_counter() - mark, time.perf_counter()
 
-    # 3. 模型推理
-    with torch.no_grad():
-        pred = model_new(input_tensor)
-        predicted_index = pred.argmax(1).item()
-        confidence = pred.softmax(1).max().item() # 计算置信度(概率)
+    # 3. 模型推理 (交给批处理器，和其他并发请求一起做一次前向传播)
+    predicted_index, confidence, forward = await batcher.submit(image)
+    # 排队凑批的时间 = 总等待时间 - 这个批次真正的推理时间
+    infer = time.perf_counter() - mark
+    stages["queue"], stages["forward"] = max(infer - forward, 0.0), forward
+    mark = time.perf_counter()
 
-    # 4. 返回结果
-    return {
+    # 4. 返回结果 (JSONResponse 在构造时就完成序列化，所以可以单独计时)
+    response = JSONResponse({
         "filename": file.filename,
         "prediction": classes[predicted_index], # 预测的类别名
         "confidence": f"{confidence*100:.2f}%"  # 这是一个百分比
-    }
\ No newline at end of file
+    })
+    stages["serialize"] = time.perf_counter() - mark
+    response.headers["Server-Timing"] = server_timing(stages)
+    return response
+
+
+@app.post("/predict/batch")
+async def predict_batch(
+    files: List[UploadFile] = File(...),
+    format: str = Query("images", description="images: 多张图片; zip: 图片压缩包; raw: N×28×28 的 uint8 原始像素"),
+):
+    """
+    批量预测：一个请求里上传很多张图片，只做一次预处理和一次前向传播
+    """
+    # 1. 读取上传内容，统一整理成 (名字, 字节流) 列表
+    items = []
+    unzipped_bytes = 0
+    for file in files:
+        data = await file.read()
+        if format == "zip":
+            try:
+                archive = zipfile.ZipFile(io.BytesIO(data))
+            except zipfile.BadZipFile as e:
+                return {"error": f"压缩包无法读取: {str(e)}"}
+            with archive:
+                members = [info for info in archive.infolist() if not info.is_dir()]
+                # 先看目录里的文件数和解压后大小，超限直接拒绝，避免小压缩包解压出大量数据
+                unzipped_bytes += sum(info.file_size for info in members)
+                if len(items) + len(members) > BATCH_MAX_ITEMS:
+                    return {"error": f"一次最多预测 {BATCH_MAX_ITEMS} 张图片，本次收到 {len(items) + len(members)} 张"}
+                if unzipped_bytes > BATCH_MAX_UNZIPPED_MB * 2**20:
+                    return {"error": f"压缩包解压后超过 {BATCH_MAX_UNZIPPED_MB:g} MB"}
+                for info in members:
+                    items.append((info.filename, archive.read(info)))
+        else:
+            items.append((file.filename, data))
+
+    # 2. 预处理：整批一起转换成 [N, 1, 28, 28]
+    try:
+        if format == "raw":
+            # 先按字节数算出张数，超限直接拒绝，避免先把整个上传转换成 float32 (4 倍大小) 再检查
+            count = sum(len(data) // (28 * 28) for _, data in items)
+            if count > BATCH_MAX_ITEMS:
+                return {"error": f"一次最多预测 {BATCH_MAX_ITEMS} 张图片，本次收到 {count} 张"}
+            names, tensors = [], []
+            for name, data in items:
+                tensor = transform_packed(data)
+                names += [f"{name}[{i}]" for i in range(len(tensor))]
+                tensors.append(tensor)
+            input_tensor = torch.cat(tensors)
+        elif format in ("images", "zip"):
+            if len(items) > BATCH_MAX_ITEMS:
+                return {"error": f"一次最多预测 {BATCH_MAX_ITEMS} 张图片，本次收到 {len(items)} 张"}
+            names = [name for name, _ in items]
+            # 多张图片并行解码，再整批一次完成反转和归一化
+            images = await decode_executor.map(decode_image, [data for _, data in items])
+            input_tensor = to_tensor(np.stack(images)) if images else None
+        else:
+            return {"error": f"不支持的 format: {format}"}
+    except ServerBusy:
+        raise
+    except Exception as e:
+        return {"error": f"图片处理失败: {str(e)}"}
+
+    if not names:
+        return {"error": "没有收到任何图片"}
+    if len(names) > BATCH_MAX_ITEMS:
+        return {"error": f"一次最多预测 {BATCH_MAX_ITEMS} 张图片，本次收到 {len(names)} 张"}
+
+    # 3. 一次前向传播 (放到推理线程池里，不阻塞事件循环)
+    indices, confidences = await infer_executor.run(run_model, model_new, input_tensor)
+
+    # 4. 返回每张图片的结果
+    return {
+        "count": len(names),
+        "results": [
+            {
+                "filename": name,
+                "prediction": classes[index],
+                "confidence": f"{confidence*100:.2f}%",
+            }
+            for name, index, confidence in zip(names, indices, confidences)
+        ],
+    }
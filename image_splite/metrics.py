@@ -0,0 +1,74 @@
+import sys
+import time
+
+
+def peak_rss_mb():
+    """进程的峰值常驻内存 (MB)；Windows 上没有 resource 模块，返回 None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    # Linux 上 ru_maxrss 的单位是 KB，macOS 上是字节
+    unit = 2**20 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit
+
+
+class ThroughputMeter:
+    """
+    训练循环的计时器：把每一步拆成 "等数据" (data wait) 和 "计算" (compute) 两段，
+    用来判断瓶颈在数据加载还是在模型本身。只用 perf_counter，不会触发 GPU 同步
+    (所以在 GPU 上 compute 只包含把算子提交出去的时间，吞吐量仍然是准确的)。
+    """
+
+    def __init__(self):
+        self.samples = 0
+        self.steps = 0
+        self.data_wait = 0.0
+        self.compute = 0.0
+        self._window = (0, 0, 0.0, 0.0)  # 上一次 window() 时的 (samples, steps, data_wait, compute)
+        self._started = self._window_started = self._mark = time.perf_counter()
+
+    def data_ready(self):
+        """拿到一个批次时调用：上一步结束到现在的时间都算作等数据"""
+        now = time.perf_counter()
+        self.data_wait += now - self._mark
+        self._mark = now
+
+    def step_done(self, batch_size):
+        """一步训练 (forward + backward + step) 结束时调用"""
+        now = time.perf_counter()
+        self.compute += now - self._mark
+        self._mark = now
+        self.samples += batch_size
+        self.steps += 1
+
+    def _stats(self, samples, steps, data_wait, compute, elapsed):
+        steps = max(steps, 1)
+        return {
+            "samples_per_sec": samples / elapsed if elapsed > 0 else 0.0,
+            "data_wait_ms": data_wait / steps * 1000,
+            "compute_ms": compute / steps * 1000,
+            "data_wait_frac": data_wait / (data_wait + compute) if data_wait + compute > 0 else 0.0,
+        }
+
+    def window(self):
+        """距离上一次调用以来的平均指标 (用于每隔 N 步记录一次)"""
+        now = time.perf_counter()
+        samples, steps, data_wait, compute = self._window
+        stats = self._stats(
+            self.samples - samples, self.steps - steps,
+            self.data_wait - data_wait, self.compute - compute, now - self._window_started,
+        )
+        self._window = (self.samples, self.steps, self.data_wait, self.compute)
+        self._window_started = now
+        return stats
+
+    def summary(self):
+        """整个 epoch 的指标"""
+        elapsed = time.perf_counter() - self._started
+        stats = self._stats(self.samples, self.steps, self.data_wait, self.compute, elapsed)
+        stats["epoch_seconds"] = elapsed
+        rss = peak_rss_mb()
+        if rss is not None:
+            stats["peak_rss_mb"] = rss
+        return stats
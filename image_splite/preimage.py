@@ -4,29 +4,122 @@ import torch
 
 device = torch.accelerator.current_accelerator().type if torch.accelerator.is_available() else "cpu"
 
-def transform_image(image_bytes):
+# 查找表 (LUT)：把 "颜色反转 + 归一化" 合并成一次查表
+# 反转: 255 - x；归一化: / 255.0  =>  (255 - x) / 255.0，结果直接是 float32
+_INVERT_NORMALIZE = ((255 - np.arange(256)) / 255.0).astype(np.float32)
+_NORMALIZE = (np.arange(256) / 255.0).astype(np.float32)
+
+# JPEG 支持按 1/2、1/4、1/8 直接解码 (在 DCT 阶段缩小)，大图可以少解很多像素
+_REDUCED_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+    (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+    (2, cv2.IMREAD_REDUCED_GRAYSCALE_2),
+)
+
+
+def _jpeg_size(image_bytes):
+    """只读 JPEG 头部 (SOF 段) 拿到 (宽, 高)，不做解码；不是 JPEG 或解析失败返回 None"""
+    if image_bytes[:2] != b"\xff\xd8":
+        return None
+    i = 2
+    while i + 9 <= len(image_bytes):
+        if image_bytes[i] != 0xFF:
+            return None
+        marker = image_bytes[i + 1]
+        # SOF0 ~ SOF15 (排除 DHT/JPG/DAC) 里记录了图片尺寸
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height = int.from_bytes(image_bytes[i + 5:i + 7], "big")
+            width = int.from_bytes(image_bytes[i + 7:i + 9], "big")
+            return width, height
+        i += 2 + int.from_bytes(image_bytes[i + 2:i + 4], "big")
+    return None
+
+
+def _decode_flag(image_bytes):
+    """挑一个缩小倍数最大、但缩小后仍不小于 28x28 的解码方式"""
+    size = _jpeg_size(image_bytes)
+    if size is not None:
+        width, height = size
+        for factor, flag in _REDUCED_FLAGS:
+            if width // factor >= 28 and height // factor >= 28:
+                return flag
+    return cv2.IMREAD_GRAYSCALE
+
+
+def decode_image(image_bytes, out=None):
     """
-    将用户上传的图片字节流，转换为模型能看懂的 Tensor
+    字节 -> 灰度图 -> 28x28 (uint8)
+    out: 可选，预先分配好的 [28, 28] uint8 数组，缩放结果直接写进去
+    只用到 numpy/cv2，可以放到线程池或进程池里执行
     """
-    # A. 字节 -> OpenCV 图像格式
+    # A. 字节 -> OpenCV 图像格式 (frombuffer 不复制数据；大 JPEG 直接按缩小倍数解码)
     nparr = np.frombuffer(image_bytes, np.uint8)
-    img = cv2.imdecode(nparr, cv2.IMREAD_GRAYSCALE) # 1. 转为灰度图
+    img = cv2.imdecode(nparr, _decode_flag(image_bytes))
+    if img is None:
+        raise ValueError("无法解码图片，请确认是 PNG/JPEG 等常见格式")
+
+    # B. 缩放 -> 28x28 (已经是 28x28 就不用再缩放)
+    if img.shape == (28, 28):
+        if out is None:
+            return img
+        out[...] = img
+        return out
+    return cv2.resize(img, (28, 28), dst=out)
+
+
+def normalize_into(images, out, invert=True):
+    """
+    uint8 图片 -> float32，一次查表同时完成颜色反转和归一化，直接写进 out (不产生中间数组)
+
+    C. 颜色反转 (关键步骤！)
+    真实照片通常是白底黑物，但 FashionMNIST 是黑底白物。
+    如果不反转，模型会把背景当成衣服，预测全错。
+    D. 归一化 (0-255 -> 0-1) 并转为 float32
+    """
+    # uint8 下标一定在 0~255 之间，mode="clip" 可以让 numpy 直接写 out，不走内部缓冲
+    np.take(_INVERT_NORMALIZE if invert else _NORMALIZE, images, out=out, mode="clip")
+    return out
 
-    # B. 缩放 -> 28x28
-    img = cv2.resize(img, (28, 28))
 
-    # C. 颜色反转 (关键步骤！)
-    # 真实照片通常是白底黑物，但 FashionMNIST 是黑底白物。
-    # 如果不反转，模型会把背景当成衣服，预测全错。
-    img = cv2.bitwise_not(img)
+def new_batch_buffer(batch_size):
+    """
+    预先分配 [N, 1, 28, 28] 的 float32 缓冲区，可以反复复用
+    用 GPU 时分配锁页内存 (pinned memory)，拷贝到显卡时可以异步进行
+    """
+    return torch.empty((batch_size, 1, 28, 28), dtype=torch.float32, pin_memory=(device == "cuda"))
+
+
+def to_device(batch):
+    """CPU 上直接返回同一个 Tensor (不复制)；GPU 上从锁页内存异步拷贝"""
+    if device == "cpu":
+        return batch
+    return batch.to(device, non_blocking=True)
+
+
+def to_tensor(images, invert=True):
+    """
+    [N, 28, 28] uint8 -> [N, 1, 28, 28] float32 Tensor
+    反转 + 归一化对整个批次只做一次查表，结果直接写进 Tensor 自己的内存
+    """
+    batch = new_batch_buffer(len(images))
+    # E/F. batch.numpy() 和 Tensor 共享内存，写进去就等于写进 Tensor
+    normalize_into(images, batch.numpy()[:, 0], invert=invert)
+    return to_device(batch)
 
-    # D. 归一化 (0-255 -> 0-1) 并转为 float32
-    img = img.astype(np.float32) / 255.0
 
-    # E. 转换为 PyTorch Tensor
-    tensor = torch.from_numpy(img)
+def transform_image(image_bytes):
+    """
+    将用户上传的图片字节流，转换为模型能看懂的 Tensor ([1, 1, 28, 28])
+    """
+    return to_tensor(decode_image(image_bytes)[None])
 
-    # F. 增加维度 [28, 28] -> [1, 1, 28, 28] (Batch, Channel, H, W)
-    tensor = tensor.unsqueeze(0).unsqueeze(0)
-    
-    return tensor.to(device)
\ No newline at end of file
+
+def transform_packed(buffer):
+    """
+    打包好的原始像素 (N x 28 x 28 个 uint8，按行存储) -> [N, 1, 28, 28] Tensor
+    约定这种格式和 FashionMNIST 原始数据一样是黑底白物，所以不做颜色反转。
+    """
+    if len(buffer) == 0 or len(buffer) % (28 * 28) != 0:
+        raise ValueError(f"原始像素长度 {len(buffer)} 不是 28*28 的整数倍")
+    images = np.frombuffer(buffer, np.uint8).reshape(-1, 28, 28)
+    return to_tensor(images, invert=False)
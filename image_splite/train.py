@@ -0,0 +1,292 @@
+import argparse
+import os
+
+import mlflow
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from torch import nn
+from torch.nn.parallel import DistributedDataParallel
+from torch.utils.data import DataLoader
+from torch.utils.data.distributed import DistributedSampler
+from torchvision import datasets
+from torchvision.transforms import ToTensor
+
+from model import MyFashionModel
+from fast_data import FastBatchLoader, MmapFashionMNIST, collate_batch
+from metrics import ThroughputMeter
+
+# 训练相关的东西 (数据集、DataLoader、优化器) 都放在这个文件里，
+# 并且只在真正训练时才创建，服务端 (main.py) 只需要 model.py 里的模型定义。
+
+# 设置批次大小 (一次训练64张图片)
+batch_size = 64
+
+# 1. 自动检测设备
+# 如果有NVIDIA显卡则用cuda，如果是Mac M1/M2则用mps，否则用cpu
+device = torch.accelerator.current_accelerator().type if torch.accelerator.is_available() else "cpu"
+
+
+def get_datasets(root="data"):
+    """创建 (训练集, 测试集)，第一次调用时会自动下载"""
+    # Download training data from open datasets.
+    training_data = datasets.FashionMNIST(
+        root=root,
+        train=True,
+        download=True,
+        transform=ToTensor(),
+    )
+
+    # Download test data from open datasets.
+    test_data = datasets.FashionMNIST(
+        root=root,
+        train=False,
+        download=True,
+        transform=ToTensor(),
+    )
+    return training_data, test_data
+
+
+def get_dataloaders(batch_size=batch_size, root="data", backend="mmap",
+                    workers=0, prefetch_factor=2, rank=0, world_size=1):
+    """
+    backend="mmap": memory-map 原始 idx 文件，按批次向量化转换 (快，默认)
+    backend="torchvision": 原来的 datasets.FashionMNIST + DataLoader (逐张走 PIL + ToTensor)
+    workers > 0 时使用多进程 DataLoader (常驻 worker + 预取)；
+    world_size > 1 时训练集按进程切分 (DistributedSampler)，每个进程只读自己那一份
+    """
+    if backend == "mmap":
+        training_data, test_data = MmapFashionMNIST(root, train=True), MmapFashionMNIST(root, train=False)
+        # mmap 数据集按整批取数，DataLoader 不需要再合并
+        collate_fn = collate_batch
+    elif backend == "torchvision":
+        training_data, test_data = get_datasets(root)
+        collate_fn = None
+    else:
+        raise ValueError(f"未知的数据加载方式: {backend}")
+
+    if backend == "mmap" and workers == 0 and world_size == 1:
+        # 单进程时直接按批次切片，连 DataLoader 的采样开销都省掉
+        train_dataloader = FastBatchLoader(training_data, batch_size=batch_size, shuffle=True)
+        test_dataloader = FastBatchLoader(test_data, batch_size=batch_size, shuffle=False)
+    else:
+        loader_kwargs = {"collate_fn": collate_fn, "pin_memory": device == "cuda"}
+        if workers > 0:
+            # persistent_workers: 每个 epoch 不用重新创建子进程；prefetch_factor: 每个 worker 提前准备几个批次
+            loader_kwargs.update(num_workers=workers, persistent_workers=True, prefetch_factor=prefetch_factor)
+        train_sampler = DistributedSampler(training_data, num_replicas=world_size, rank=rank) if world_size > 1 else None
+        # 1. 创建训练集加载器 (注意 shuffle=True，分布式时由 sampler 负责打乱)
+        train_dataloader = DataLoader(training_data, batch_size=batch_size, shuffle=train_sampler is None,
+                                      sampler=train_sampler, **loader_kwargs)
+        # 2. 创建测试集加载器 (注意 shuffle=False)
+        test_dataloader = DataLoader(test_data, batch_size=batch_size, shuffle=False, **loader_kwargs)
+    print(f"DataLoader 创建完成！(backend: {backend}, workers: {workers})")
+    return train_dataloader, test_dataloader
+
+
+def train(dataloader, model, loss_fn, optimizer, log_fn=None, log_every=100, epoch=0):
+    """
+    训练一个 epoch，返回这个 epoch 的吞吐量/耗时指标和平均 loss
+    log_fn(metrics, step): 每隔 log_every 步调用一次，用来把指标记到 MLflow
+    """
+    size = len(dataloader.dataset)
+    model.train() # 切换到训练模式
+    meter = ThroughputMeter()
+    # loss 累加在设备上，不在每个批次调用 .item() (那会强制 CPU 等 GPU 算完)
+    loss_sum = torch.zeros((), device=device)
+
+    # 从 DataLoader 里一批一批地拿数据
+    for batch, (X, y) in enumerate(dataloader):
+        meter.data_ready()
+        # 【重要】把数据也搬到显卡上，否则会报错！
+        X, y = X.to(device, non_blocking=True), y.to(device, non_blocking=True)
+
+        # --- 五步走核心 ---
+
+        # 1. 计算预测值 (Forward)
+        pred = model(X)
+
+        # 2. 计算误差 (Loss)
+        loss = loss_fn(pred, y)
+
+        # 3. 梯度清零 (Zero Grad)
+        # 每次更新前必须把上一次算的梯度清空，否则会累加
+        optimizer.zero_grad()
+
+        # 4. 反向传播 (Backward)
+        # 计算每个参数对误差的贡献(梯度)
+        loss.backward()
+
+        # 5. 参数更新 (Step)
+        # 根据梯度，调整参数
+        optimizer.step()
+
+        # ----------------
+        loss_sum += loss.detach() * len(X)
+        meter.step_done(len(X))
+
+        # 每隔100个批次打印一次进度
+        if batch % log_every == 0:
+            loss, current = loss.item(), (batch + 1) * len(X)
+            window = meter.window()
+            print(f"loss: {loss:>7f}  [{current:>5d}/{size:>5d}]  "
+                  f"{window['samples_per_sec']:>7.0f} samples/s  "
+                  f"data {window['data_wait_ms']:.2f}ms / compute {window['compute_ms']:.2f}ms")
+            if log_fn is not None:
+                log_fn({"step_loss": loss, **{f"step_{k}": v for k, v in window.items()}},
+                       epoch * len(dataloader) + batch)
+
+    stats = meter.summary()
+    stats["train_loss"] = (loss_sum / max(meter.samples, 1)).item() # 整个 epoch 只同步这一次
+    return stats
+
+
+def test(dataloader, model, loss_fn):
+    size = len(dataloader.dataset)
+    num_batches = len(dataloader)
+    model.eval() # 切换到评估模式 (很重要！)
+    # 同样累加在设备上，最后只同步一次
+    test_loss = torch.zeros((), device=device)
+    correct = torch.zeros((), device=device)
+
+    # with torch.no_grad() 表示："接下来的计算不需要算梯度"
+    # 这样可以省显存，加速计算
+    with torch.no_grad():
+        for X, y in dataloader:
+            X, y = X.to(device), y.to(device)
+            pred = model(X)
+            test_loss += loss_fn(pred, y)
+            # 统计猜对的个数
+            correct += (pred.argmax(1) == y).sum()
+
+    test_loss = test_loss.item() / num_batches
+    correct = correct.item() / size
+    print(f"Test Error: \n Accuracy: {(100*correct):>0.1f}%, Avg loss: {test_loss:>8f} \n")
+    return {"test_accuracy": correct, "test_loss": test_loss}
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="训练 MyFashionModel")
+    parser.add_argument("--epochs", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=batch_size, help="每个进程的批次大小")
+    parser.add_argument("--lr", type=float, default=1e-3, help="批次大小为 64 时的学习率")
+    parser.add_argument("--scale-lr", action="store_true",
+                        help="按总批次大小线性放大学习率: lr * batch_size * world_size / 64")
+    parser.add_argument("--data-backend", choices=["mmap", "torchvision"], default=os.getenv("DATA_BACKEND", "mmap"))
+    parser.add_argument("--workers", type=int, default=0, help="DataLoader 子进程数 (0 表示在主进程里取数)")
+    parser.add_argument("--prefetch-factor", type=int, default=2, help="每个 worker 预取的批次数")
+    parser.add_argument("--threads", type=int, default=0,
+                        help="每个训练进程的计算线程数 (0 表示 CPU 核数 / 进程数)")
+    parser.add_argument("--interop-threads", type=int, default=0, help="算子间并行线程数 (0 表示默认)")
+    parser.add_argument("--world-size", type=int, default=1,
+                        help="单机多进程数据并行的进程数 (gloo 后端，CPU 训练用)")
+    parser.add_argument("--eval", action="store_true", help="每个 epoch 结束后在测试集上评估")
+    return parser.parse_args()
+
+
+def configure_threads(threads, interop_threads, world_size):
+    """
+    显式设置 torch 的线程数：多进程训练时每个进程分一份 CPU 核，避免线程数超过核数互相抢占
+    """
+    if threads <= 0:
+        threads = max(1, (os.cpu_count() or 1) // world_size)
+    torch.set_num_threads(threads)
+    if interop_threads > 0:
+        torch.set_num_interop_threads(interop_threads)
+    return threads
+
+
+def run(rank, world_size, args):
+    """训练入口；world_size > 1 时每个进程都会执行一次 (rank 是进程编号)"""
+    if world_size > 1:
+        # 单机多进程：用本机地址做进程组的集合点，gloo 后端支持 CPU 上的梯度 all-reduce
+        os.environ.setdefault("MASTER_ADDR", "127.0.0.1")
+        os.environ.setdefault("MASTER_PORT", "29500")
+        dist.init_process_group("gloo", rank=rank, world_size=world_size)
+    is_main = rank == 0
+
+    threads = configure_threads(args.threads, args.interop_threads, world_size)
+    train_dataloader, test_dataloader = get_dataloaders(
+        batch_size=args.batch_size, backend=args.data_backend, workers=args.workers,
+        prefetch_factor=args.prefetch_factor, rank=rank, world_size=world_size,
+    )
+
+    if is_main:
+        # 从 DataLoader 中通过 for 循环取出一批数据
+        for X, y in train_dataloader:
+            print(f"Shape of X [N, C, H, W]: {X.shape}")
+            print(f"Shape of y: {y.shape} {y.dtype}")
+            break # 我们只看第一批，看完就跳出循环
+
+        print(f"Using {device} device, {threads} threads x {world_size} processes")
+
+    # 2. 实例化模型 (造出来)
+    model = MyFashionModel()
+
+    # 3. 搬运模型 (关键步骤！)
+    # 这一步会把模型里所有的权重矩阵(Weights)移动到显存里
+    model.to(device)
+    if world_size > 1:
+        # 每个进程算自己那份数据的梯度，backward 时自动 all-reduce 求平均
+        model = DistributedDataParallel(model)
+
+    if is_main:
+        print(model) # 打印看看结构
+
+    # 1. 定义损失函数
+    # 对于分类问题(10类衣服)，最常用的是 CrossEntropyLoss (交叉熵损失)
+    loss_fn = nn.CrossEntropyLoss()
+
+    # 2. 定义优化器
+    # SGD (随机梯度下降) 是最经典的优化器。
+    # model.parameters() 告诉优化器："你要调整的是这个模型里的参数"
+    # lr (Learning Rate) 是学习率，决定了参数调整的步子大小
+    # 大批次训练时按线性缩放规则放大学习率，保证每个样本的更新幅度大致不变
+    lr = args.lr
+    if args.scale_lr:
+        lr = args.lr * args.batch_size * world_size / 64
+    optimizer = torch.optim.SGD(model.parameters(), lr=lr)
+
+    # 只在主进程记录 MLflow：参数记一次，每隔 100 步记一次步级指标，每个 epoch 记一次汇总指标
+    log_fn = mlflow.log_metrics if is_main else None
+    if is_main:
+        # 设定 MLflow 实验 (Tracking)，如果实验不存在，它会被创建
+        # (放在这里而不是 __main__ 里，因为多进程时 rank 0 是新启动的子进程)
+        mlflow.set_experiment("Image_Splite_Demo")
+        mlflow.start_run()
+        mlflow.log_params({**vars(args), "lr_effective": lr, "threads": threads, "device": device})
+
+    for t in range(args.epochs):
+        if is_main:
+            print(f"Epoch {t+1}\n-------------------------------")
+        if isinstance(getattr(train_dataloader, "sampler", None), DistributedSampler):
+            train_dataloader.sampler.set_epoch(t) # 每个 epoch 换一种打乱方式
+        stats = train(train_dataloader, model, loss_fn, optimizer, log_fn=log_fn, epoch=t) # 训练
+        if args.eval and is_main:
+            # 只在主进程评估，直接用 DDP 里面的模型，不触发进程间同步
+            stats.update(test(test_dataloader, model.module if world_size > 1 else model, loss_fn)) # 考试
+        if is_main:
+            # 多进程时 samples_per_sec 是单个进程的吞吐量，总吞吐量约为它乘以进程数
+            print(f"Epoch {t+1}: {stats['samples_per_sec']:.0f} samples/s, "
+                  f"data wait {stats['data_wait_frac']*100:.1f}%, {stats['epoch_seconds']:.1f}s")
+            mlflow.log_metrics({f"epoch_{k}": v for k, v in stats.items()}, step=t)
+
+    if is_main:
+        print("Done!")
+        # 保存模型参数到文件 'model_weights.pth' (DDP 包了一层，要取里面的 module)
+        state_dict = model.module.state_dict() if world_size > 1 else model.state_dict()
+        torch.save(state_dict, "model_weights.pth")
+        print("模型参数已保存到 model_weights.pth")
+        mlflow.end_run()
+
+    if world_size > 1:
+        dist.destroy_process_group()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    if args.world_size > 1:
+        # 单机多进程数据并行：每个进程一个模型副本，梯度通过 gloo 同步
+        mp.spawn(run, args=(args.world_size, args), nprocs=args.world_size)
+    else:
+        run(0, 1, args)
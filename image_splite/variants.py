@@ -0,0 +1,156 @@
+"""
+MyFashionModel 的几种 CPU 部署形态 (variant)：
+
+    eager        原始的 PyTorch 模型
+    int8         动态 int8 量化 (Linear 层权重存成 int8，激活值运行时量化)
+    traced       TorchScript trace + freeze，去掉 Python 调度开销
+    int8_traced  先量化再 trace
+    compiled     torch.compile (只在加载时编译，不导出文件)
+
+用法：
+    python variants.py            # 导出 traced 文件，并在 FashionMNIST 测试集上生成精度/延迟报告
+    MODEL_VARIANT=int8 uvicorn main:app   # 服务启动时选择其中一种
+"""
+import json
+import sys
+import time
+
+import numpy as np
+import torch
+from torch import nn
+
+from model import MyFashionModel
+
+VARIANTS = ("eager", "int8", "traced", "int8_traced", "compiled")
+
+WEIGHTS_PATH = "model_weights.pth"
+# trace 出来的模型要单独保存成文件，服务启动时直接 torch.jit.load
+TRACED_PATHS = {
+    "traced": "model_traced.pt",
+    "int8_traced": "model_int8_traced.pt",
+}
+REPORT_PATH = "variant_report.json"
+
+
+def _load_eager(weights_path, device):
+    model = MyFashionModel()
+    model.load_state_dict(torch.load(weights_path, map_location=device))
+    return model.to(device).eval()
+
+
+def _quantize(model):
+    # 动态量化只支持 CPU；这个模型只有两层 Linear，正好是动态量化最擅长的场景
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+
+def _trace(model):
+    example = torch.zeros(1, 1, 28, 28)
+    with torch.no_grad():
+        traced = torch.jit.trace(model, example)
+    return torch.jit.freeze(traced)
+
+
+def build_variant(name, weights_path=WEIGHTS_PATH, device="cpu"):
+    """从 fp32 权重现场构建某个 variant"""
+    if name not in VARIANTS:
+        raise ValueError(f"未知的模型 variant: {name}，可选: {', '.join(VARIANTS)}")
+    if name != "eager" and name != "compiled" and device != "cpu":
+        raise ValueError(f"variant '{name}' 只支持 CPU，当前设备是 {device}")
+
+    model = _load_eager(weights_path, device)
+    if name == "int8":
+        return _quantize(model)
+    if name == "traced":
+        return _trace(model)
+    if name == "int8_traced":
+        return _trace(_quantize(model))
+    if name == "compiled":
+        return torch.compile(model)
+    return model
+
+
+def load_variant(name, weights_path=WEIGHTS_PATH, device="cpu"):
+    """
+    服务端加载入口：traced 类的 variant 优先读取导出好的文件，
+    找不到文件时退回到从 fp32 权重现场构建
+    """
+    path = TRACED_PATHS.get(name)
+    if path is not None:
+        try:
+            return torch.jit.load(path, map_location=device).eval()
+        except (FileNotFoundError, ValueError):
+            print(f"⚠️ 找不到 {path}，从 {weights_path} 现场构建 variant '{name}'")
+    return build_variant(name, weights_path, device)
+
+
+def export_variants(weights_path=WEIGHTS_PATH):
+    """把需要 trace 的 variant 导出成文件"""
+    for name, path in TRACED_PATHS.items():
+        torch.jit.save(build_variant(name, weights_path), path)
+        print(f"✅ 已导出 {name} -> {path}")
+
+
+def _test_tensors():
+    """把整个测试集一次性转成 [10000, 1, 28, 28] 的 Tensor (等价于逐张 ToTensor)"""
+    from fast_data import MmapFashionMNIST
+    return MmapFashionMNIST(train=False).to_tensors()
+
+
+def _latency_ms(model, batch, repeats):
+    """重复推理同一个批次，返回每次调用的耗时列表 (毫秒)"""
+    with torch.no_grad():
+        for _ in range(10):  # 预热 (torch.compile 的编译时间也在这里被排除)
+            model(batch)
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            model(batch)
+            timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def evaluate_variant(model, images, labels, repeats=200):
+    """在测试集上统计精度，并测量 batch=1 和 batch=64 的推理延迟"""
+    with torch.no_grad():
+        correct = 0
+        for start in range(0, len(images), 1000):
+            pred = model(images[start:start + 1000])
+            correct += (pred.argmax(1) == labels[start:start + 1000]).sum().item()
+
+    single = _latency_ms(model, images[:1], repeats)
+    batch64 = _latency_ms(model, images[:64], repeats)
+    return {
+        "accuracy": correct / len(images),
+        "batch1_p50_ms": float(np.percentile(single, 50)),
+        "batch1_p99_ms": float(np.percentile(single, 99)),
+        "batch64_p50_ms": float(np.percentile(batch64, 50)),
+        "batch64_images_per_sec": 64 * 1000 / float(np.percentile(batch64, 50)),
+    }
+
+
+def build_report(weights_path=WEIGHTS_PATH, names=VARIANTS):
+    """逐个 variant 在 FashionMNIST 测试集上跑一遍，返回 {variant: 指标}"""
+    images, labels = _test_tensors()
+    report = {}
+    for name in names:
+        print(f"⏳ 评估 variant '{name}' ...")
+        report[name] = evaluate_variant(build_variant(name, weights_path), images, labels)
+    return report
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or VARIANTS
+
+    export_variants()
+    report = build_report(names=names)
+
+    print(f"\n{'variant':<12} {'accuracy':>9} {'b1 p50(ms)':>11} {'b1 p99(ms)':>11} {'b64 img/s':>10}")
+    for name, row in report.items():
+        print(
+            f"{name:<12} {row['accuracy']*100:>8.2f}% {row['batch1_p50_ms']:>11.3f} "
+            f"{row['batch1_p99_ms']:>11.3f} {row['batch64_images_per_sec']:>10.0f}"
+        )
+
+    with open(REPORT_PATH, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n报告已保存到 {REPORT_PATH}")
@@ -1,91 +1,320 @@
 # app.py
+import asyncio
 import mlflow.pyfunc
 import mlflow
-import pandas as pd
 import time
-from fastapi import FastAPI, Request
-from prometheus_client import make_asgi_app, Counter, Histogram
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Query, Request, Response
+from prometheus_client import make_asgi_app, Counter, Gauge, Histogram
 import uvicorn
 
 import os
+from batcher import PredictBatcher, ServerBusy
+from payloads import PayloadError, encode_json, parse_payload
+from model_pool import ModelPool, is_not_found
+import profiler
+from registry import LoadedModel, RegistryWatcher, load_version, resolve_version
 #设置使用本地SQLite数据库
 db_path = os.path.abspath(os.path.join(os.getcwd(), "mlruns", "mlflow.db"))
-#DB_URI = f"sqlite:///{db_path}"
-#print(DB_URI)
-#mlflow.set_tracking_uri(DB_URI)
+# 注册表地址：优先用环境变量 MLFLOW_TRACKING_URI (MLflow 自己会读)；
+# 没设置时，如果当前目录下有 pipeline_demo 用的 mlruns/mlflow.db，就用这个 SQLite 注册表
+if not os.getenv("MLFLOW_TRACKING_URI") and os.path.exists(db_path):
+    DB_URI = f"sqlite:///{db_path}"
+    print(DB_URI)
+    mlflow.set_tracking_uri(DB_URI)
+
+# 请求合并：并发请求的行拼成一批，在工作线程里一次 predict (BATCHING=0 关闭)
+BATCHING = os.getenv("BATCHING", "1") == "1"
+BATCH_MAX_ROWS = int(os.getenv("BATCH_MAX_ROWS", "512"))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "2"))
+BATCH_MAX_QUEUE = int(os.getenv("BATCH_MAX_QUEUE", "1024"))
+PREDICT_WORKERS = int(os.getenv("PREDICT_WORKERS", "1"))
+# 多模型服务 (/models/{name}/{version}/invocations)：最多同时加载几个模型、估算内存上限 (MB，0 不限)
+MAX_LOADED_MODELS = int(os.getenv("MAX_LOADED_MODELS", "4"))
+MAX_MODEL_MEMORY_MB = float(os.getenv("MAX_MODEL_MEMORY_MB", "0"))
+# 采样 profiler 接口 (/debug/profile)，默认关闭；PROFILER_ENABLED=1 时开启
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "0") == "1"
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # 凑批、轮询注册表的后台任务要在事件循环里启动
+    if batcher is not None:
+        await batcher.start()
+    if watcher is not None:
+        await watcher.start()
+    yield
+    if watcher is not None:
+        await watcher.stop()
+    if batcher is not None:
+        await batcher.stop()
 
 # 1. 初始化 FastAPI 应用
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # 2. 定义 Prometheus 指标 (Metrics)
 # Counter: 只增不减的计数器，用于统计请求总量
 REQUEST_COUNT = Counter(
     'model_request_count',          # 指标名称
     'Total number of model requests', # 描述
-    ['status']                      # 标签: 成功/失败
+    ['status', 'model', 'version']  # 标签: 成功/失败、模型名、版本
 )
 
 # Histogram: 直方图，用于统计耗时分布 (P99, P95, Avg Latency)
+# 成功和失败的请求都计时 (status 标签区分)
 REQUEST_LATENCY = Histogram(
     'model_request_latency_seconds',
-    'Model inference latency in seconds'
+    'Model inference latency in seconds',
+    ['status', 'model', 'version']
 )
 
+# 每个阶段的耗时：read (读请求体) / parse (解析成数组) / frame (转换成模型输入) / predict (排队+推理) / encode (序列化)
+STAGE_LATENCY = Histogram(
+    'model_request_stage_seconds',
+    'Per-stage latency of /invocations in seconds',
+    ['stage', 'model', 'version'],
+    buckets=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+)
+
+# 请求体大小和每个请求的行数
+PAYLOAD_BYTES = Histogram(
+    'model_request_payload_bytes',
+    'Request body size in bytes',
+    ['model'],
+    buckets=(64, 256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+)
+REQUEST_ROWS = Histogram(
+    'model_request_rows',
+    'Rows per request',
+    ['model'],
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+)
+
+# 正在处理的请求数
+IN_FLIGHT = Gauge(
+    'model_requests_in_flight',
+    'Requests currently being processed',
+    ['model']
+)
+
+# 凑批效果：每次 predict 的行数/请求数，以及请求在队列里等了多久
+BATCH_ROWS = Histogram(
+    'model_batch_rows',
+    'Rows per model.predict call',
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+)
+BATCH_REQUESTS = Histogram(
+    'model_batch_requests',
+    'Requests coalesced into one model.predict call',
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128)
+)
+QUEUE_WAIT = Histogram(
+    'model_queue_wait_seconds',
+    'Time a request waits in the batching queue',
+    buckets=(0.0001, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+)
+
+# 当前正在服务的模型版本 (值为 1 的那个标签组合就是当前版本)，以及热更新的次数
+ACTIVE_MODEL = Gauge(
+    'model_active_version',
+    'Currently served model version',
+    ['model', 'version']
+)
+MODEL_RELOADS = Counter(
+    'model_reload_count',
+    'Model hot reloads from the registry',
+    ['status']
+)
+
+# 多模型 LRU：加载次数/耗时、淘汰次数、当前加载的模型数和估算内存
+POOL_METRICS = {
+    "loads": Counter('model_pool_load_count', 'Model loads into the LRU pool', ['model', 'status']),
+    "load_seconds": Histogram('model_pool_load_seconds', 'Time to download, load and warm a model'),
+    "evictions": Counter('model_pool_eviction_count', 'Models evicted from the LRU pool', ['model']),
+    "loaded": Gauge('model_pool_loaded_models', 'Models currently loaded in the LRU pool'),
+    "loaded_bytes": Gauge('model_pool_loaded_bytes', 'Estimated memory of models loaded in the LRU pool'),
+}
+
 # 3. 创建 Prometheus 的 metrics 接口 (/metrics)
 # Prometheus 会定期访问这个接口抓取数据
 metrics_app = make_asgi_app()
 app.mount("/metrics", metrics_app)
 
 # 4. 加载模型
-# ⚠️ 注意：为了 Demo 方便，这里我们写死模型路径
-# 在 Docker 中，我们会把本地的 mlruns 挂载进去
-# 假设我们加载 DemoModel 的最新生产版本或特定版本
-#MODEL_URI = "models:/RandomForestModel/Latest" # 或者使用本地路径
-
-#Run ID: 3967c8324f23425eb7abb942376d2c4c
-MODEL_URI = "/app/mlruns/419493442711422412/models/m-d3e89cdc620242159a62f4007e1c1b59/artifacts"
+# 默认从 Model Registry 加载 models:/<MODEL_NAME>/<MODEL_STAGE>，并每 MODEL_POLL_SECONDS 秒检查一次：
+# pipeline_demo 的 promote_model() 把新版本 (DemoModel) 推到 Production 后，服务会在后台加载、预热并切换，不需要重启容器
+# (mlflow_train.py 注册的是 RandomForestModel，只注册不推到 Production，要服务它请设置 MODEL_NAME / MODEL_STAGE)
+MODEL_NAME = os.getenv("MODEL_NAME", "DemoModel")
+MODEL_STAGE = os.getenv("MODEL_STAGE", "Production")  # 也可以写成 @别名，例如 @champion
+MODEL_POLL_SECONDS = float(os.getenv("MODEL_POLL_SECONDS", "30"))  # 0 表示不轮询
+# 设置 MODEL_URI 时直接加载这个路径 (不热更新)，例如 Docker 里挂载进来的 artifacts 目录：
+#MODEL_URI = "/app/mlruns/419493442711422412/models/m-d3e89cdc620242159a62f4007e1c1b59/artifacts"
 #MODEL_URI = "file:///E:/study/docker_demo/monitor_demo/mlruns/419493442711422412/models/m-d3e89cdc620242159a62f4007e1c1b59/artifacts"
+MODEL_URI = os.getenv("MODEL_URI")
+
+if MODEL_URI:
+    print(f"正在加载模型: {MODEL_URI} ...")
+    current = LoadedModel(MODEL_NAME, "static", mlflow.pyfunc.load_model(MODEL_URI))
+else:
+    try:
+        initial_version = resolve_version(MODEL_NAME, MODEL_STAGE)
+    except Exception as e:
+        print(f"⚠️ 查询注册表失败: {e}")
+        initial_version = None
+    if initial_version is None:
+        # 不退出：先启动服务 (/invocations 返回 503)，轮询到 MODEL_STAGE 有版本后自动加载
+        print(f"⚠️ 注册表里还没有 {MODEL_NAME} 的 {MODEL_STAGE} 版本，等待发布 (或设置 MODEL_URI 直接加载模型)")
+        current = None
+    else:
+        print(f"正在加载模型: models:/{MODEL_NAME}/{MODEL_STAGE} (v{initial_version}) ...")
+        current = load_version(MODEL_NAME, initial_version)
+if current is not None:
+    ACTIVE_MODEL.labels(model=current.name, version=current.version).set(1)
+    print("模型加载成功！")
+
+
+def swap_model(loaded):
+    """
+    原子切换：之后到达的请求用新模型；切换前到达的请求 (包括还在凑批队列里排队的) 继续用旧模型算完，
+    输入格式、预测结果和返回的 model_version 始终是同一个版本
+    """
+    global current
+    previous, current = current, loaded
+    if previous is not None:
+        ACTIVE_MODEL.remove(previous.name, previous.version)
+    ACTIVE_MODEL.labels(model=loaded.name, version=loaded.version).set(1)
+    MODEL_RELOADS.labels(status='success').inc()
+
 
-print(f"正在加载模型: {MODEL_URI} ...")
-model = mlflow.pyfunc.load_model(MODEL_URI)
-print("模型加载成功！")
+watcher = RegistryWatcher(
+    MODEL_NAME, MODEL_STAGE, current and current.version, on_swap=swap_model, poll_seconds=MODEL_POLL_SECONDS,
+    on_error=lambda e: MODEL_RELOADS.labels(status='error').inc(),
+) if not MODEL_URI else None
+
+# 其他注册模型按需加载，放在有上限的 LRU 里
+model_pool = ModelPool(
+    max_models=MAX_LOADED_MODELS, max_bytes=int(MAX_MODEL_MEMORY_MB * 2**20), metrics=POOL_METRICS,
+)
+
+# 每个请求提交时带上自己的模型 (submit(data, served))，凑批器按模型分组，切换模型不需要重建凑批器
+batcher = PredictBatcher(
+    max_rows=BATCH_MAX_ROWS, max_wait_ms=BATCH_MAX_WAIT_MS,
+    max_queue=BATCH_MAX_QUEUE, workers=PREDICT_WORKERS,
+    batch_rows=BATCH_ROWS, batch_requests=BATCH_REQUESTS, queue_wait=QUEUE_WAIT,
+) if BATCHING else None
+
+
+def json_response(content, status_code=200):
+    """用 orjson 序列化 (直接处理 NumPy 数组)，比 FastAPI 默认的 jsonable_encoder + json.dumps 快得多"""
+    return Response(encode_json(content), status_code=status_code, media_type="application/json")
 
 # 5. 定义预测接口
-@app.post("/invocations")
-async def predict(request: Request):
-    # 开始计时
-    start_time = time.time()
-    
+async def invoke(request: Request, served, predict):
+    """解析请求体 -> 按 served 的签名转换输入 -> predict(data) -> 编码返回，每个阶段分别计时"""
+    labels = {"model": served.name, "version": served.version}
+    # perf_counter 是单调时钟，不受系统时间调整影响
+    start_time = last = time.perf_counter()
+    status = 'error'
+
+    def stage(name):
+        nonlocal last
+        now = time.perf_counter()
+        STAGE_LATENCY.labels(stage=name, **labels).observe(now - last)
+        last = now
+
+    IN_FLIGHT.labels(model=served.name).inc()
     try:
-        # 获取 JSON 数据
-        json_data = await request.json()
-        
-        # 转换为 Pandas DataFrame (适配 MLflow 标准输入)
-        # 这里假设输入格式是 split 格式，如之前 demo 所示
-        if "dataframe_split" in json_data:
-            data = pd.DataFrame(**json_data["dataframe_split"])
-        else:
-            # 简单处理其他格式
-            data = pd.DataFrame(json_data)
-
-        # 模型推理
-        result = model.predict(data)
-        
-        # 记录成功指标
-        REQUEST_COUNT.labels(status='success').inc()
-        
-        # 计算耗时并记录
-        duration = time.time() - start_time
-        REQUEST_LATENCY.observe(duration)
-
-        return {"predictions": result.tolist()}
-        #return result.tolist() 需要写成返回报文的格式 因为fastapi比较自由
+        # 读取原始请求体，按 Content-Type 直接解析成 NumPy 数组
+        # (JSON: dataframe_split / dataframe_records / instances / inputs / 按列的 dict；Arrow IPC；带 X-Tensor-Shape 头的原始 float32)
+        body = await request.body()
+        PAYLOAD_BYTES.labels(model=served.name).observe(len(body))
+        stage('read')
+
+        # 按列签名的模型：按列的 JSON 直接构造 DataFrame，保留每列的类型
+        array, columns = parse_payload(body, request.headers.get("content-type"), request.headers,
+                                       frames=not served.adapter.tensor)
+        REQUEST_ROWS.labels(model=served.name).observe(len(array))
+        stage('parse')
+
+        # 只有模型签名是按列的时候才构造 DataFrame
+        data = served.adapter.adapt(array, columns)
+        stage('frame')
+
+        # 模型推理 (在工作线程里执行，不阻塞事件循环)
+        result = await predict(data)
+        stage('predict')
+
+        response = json_response({"predictions": result, "model_version": served.version})
+        stage('encode')
+        status = 'success'
+        return response
+
+    except ServerBusy as e:
+        return Response(encode_json({"error": str(e)}), status_code=503, media_type="application/json",
+                        headers={"Retry-After": "1"})
+
+    except PayloadError as e:
+        return json_response({"error": str(e)}, status_code=400)
 
     except Exception as e:
-        # 记录失败指标
-        REQUEST_COUNT.labels(status='error').inc()
         print(f"Error: {e}")
-        return {"error": str(e)}
+        return json_response({"error": str(e)})
+
+    finally:
+        # 成功、失败都记录次数和总耗时
+        IN_FLIGHT.labels(model=served.name).dec()
+        REQUEST_COUNT.labels(status=status, **labels).inc()
+        REQUEST_LATENCY.labels(status=status, **labels).observe(time.perf_counter() - start_time)
+
+@app.post("/invocations")
+async def predict(request: Request):
+    start_time = time.perf_counter()
+    served = current  # 这个请求固定用同一个版本解析输入，即使中途发生了切换
+    if served is None:
+        REQUEST_COUNT.labels(status='error', model=MODEL_NAME, version='none').inc()
+        REQUEST_LATENCY.labels(status='error', model=MODEL_NAME, version='none').observe(time.perf_counter() - start_time)
+        return Response(encode_json({"error": f"No {MODEL_NAME} version in {MODEL_STAGE} yet"}), status_code=503,
+                        media_type="application/json", headers={"Retry-After": str(int(MODEL_POLL_SECONDS) or 1)})
+    # 交给凑批器，和其他并发请求拼成一批一起算
+    if batcher is not None:
+        return await invoke(request, served, lambda data: batcher.submit(data, served))
+    return await invoke(request, served, lambda data: asyncio.to_thread(served.predict, data))
+
+@app.post("/models/{name}/{version}/invocations")
+async def predict_model(request: Request, name: str, version: str):
+    """version 可以是版本号，也可以是 Production / Staging / @别名 / latest"""
+    start_time = time.perf_counter()
+    try:
+        served = await model_pool.get(name, version)
+    except Exception as e:
+        # 标签用固定值：name / version 来自 URL，直接当标签会让任意请求制造新的时间序列
+        REQUEST_COUNT.labels(status='error', model='unknown', version='unknown').inc()
+        # 加载失败的耗时 (例如下载模型超时) 也要进延迟直方图
+        REQUEST_LATENCY.labels(status='error', model='unknown', version='unknown').observe(time.perf_counter() - start_time)
+        if is_not_found(e):
+            return json_response({"error": f"Model {name}/{version} not found: {e}"}, status_code=404)
+        return Response(encode_json({"error": f"Cannot load {name}/{version}: {e}"}), status_code=503,
+                        media_type="application/json", headers={"Retry-After": "1"})
+    return await invoke(request, served, lambda data: asyncio.to_thread(served.predict, data))
+
+# 同一时间只允许一个采样任务
+_profile_lock = asyncio.Lock()
+
+@app.get("/debug/profile")
+async def profile(seconds: float = Query(5.0, gt=0, le=60), interval_ms: float = Query(5.0, gt=0),
+                  limit: int = Query(0, ge=0)):
+    """
+    在线上负载下采样 seconds 秒所有线程的调用栈，返回折叠栈文本 (可直接画火焰图)
+    例如: curl 'localhost:5000/debug/profile?seconds=10' > stacks.txt && flamegraph.pl stacks.txt > flame.svg
+    """
+    if not PROFILER_ENABLED:
+        return json_response({"error": "Profiler is disabled, set PROFILER_ENABLED=1"}, status_code=404)
+    if _profile_lock.locked():
+        return json_response({"error": "A profile is already running"}, status_code=409)
+    async with _profile_lock:
+        # 采样在单独的线程里跑，事件循环线程也会被采到
+        counts = await asyncio.to_thread(profiler.sample, seconds, interval_ms / 1000)
+    return Response(profiler.folded(counts, limit), media_type="text/plain")
 
 if __name__ == "__main__":
     # 启动服务，监听 5000 端口
@@ -0,0 +1,180 @@
+# batcher.py
+# 请求合并 (request coalescing)：
+# 把并发到达的多个 /invocations 请求的行拼成一个批次，在工作线程里只调用一次 model.predict，
+# 再按每个请求的行数把结果切回去。随机森林这类树模型逐行预测的固定开销很大，整批预测便宜得多。
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+class ServerBusy(Exception):
+    """排队的请求太多，直接拒绝 (返回 503)，避免延迟无限增长"""
+
+
+def _concat(parts):
+    if hasattr(parts[0], "iloc"):
+        import pandas as pd
+        return pd.concat(parts, ignore_index=True)
+    return np.concatenate(parts)
+
+
+def _slice(result, start, end):
+    return result.iloc[start:end] if hasattr(result, "iloc") else result[start:end]
+
+
+def _batch_key(data, model):
+    """只有同一个模型、列/形状/类型一致的输入才能拼在一起 (热更新前后排队的请求不会混在一批里)"""
+    if hasattr(data, "columns"):
+        return (id(model), "frame", tuple(data.columns), tuple(str(t) for t in data.dtypes))
+    return (id(model), "array", data.shape[1:], data.dtype.str)
+
+
+class PredictBatcher:
+    """
+    自适应凑批：
+    - 空闲时来一个请求立刻预测，不额外等待 (低负载下不增加延迟)
+    - 预测进行中到达的请求在队列里积累，下一批一次取走
+    - 上一批确实合并了多个请求 (说明有并发) 时，才为下一批最多再等 max_wait_ms 凑更多行
+    """
+
+    def __init__(self, predict=None, max_rows=512, max_wait_ms=2.0, max_queue=1024, workers=1,
+                 batch_rows=None, batch_requests=None, queue_wait=None):
+        self.predict = predict              # 默认的 model.predict (submit 时没指定模型才用)
+        self.max_rows = max_rows            # 一个批次最多多少行
+        self.max_wait = max_wait_ms / 1000  # 有并发时最多为凑批等多久 (秒)
+        self.max_queue = max_queue          # 最多允许多少个请求排队，超过直接返回 503
+        self.workers = workers              # 预测线程数 (同时在跑的批次数)
+        # Prometheus 直方图 (可选)：每批行数、每批请求数、请求在队列里等待的时间
+        self.batch_rows = batch_rows
+        self.batch_requests = batch_requests
+        self.queue_wait = queue_wait
+        self._executor = None
+        self._queue = None
+        self._slots = None
+        self._worker = None
+        self._coalescing = False
+        self._tasks = set()  # 正在跑的批次；事件循环只保留任务的弱引用，要自己持有，否则可能被垃圾回收
+
+    async def start(self):
+        """在事件循环里启动后台凑批任务 (应用启动时调用)"""
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="predict")
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._slots = asyncio.Semaphore(self.workers)
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止后台任务，让还在排队的请求失败返回 (应用关闭时调用)"""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        # 已经开始的批次让它们算完，等待中的请求正常拿到结果
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        while self._queue is not None and not self._queue.empty():
+            _, future, _, _ = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("预测服务正在关闭"))
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+    async def submit(self, data, model=None):
+        """
+        提交一个请求的输入 (二维数组或 DataFrame)，返回这些行的预测结果
+        model: 用哪个模型预测 (有 predict 方法)；请求排队期间发生热更新也还是用它，和输入的格式、返回的版本号一致
+        """
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((data, future, time.perf_counter(), model))
+        except asyncio.QueueFull:
+            raise ServerBusy(f"预测队列已满 ({self.max_queue})，请稍后重试")
+        return await future
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        rows = len(batch[0][0])
+        deadline = loop.time() + (self.max_wait if self._coalescing else 0)
+
+        while rows < self.max_rows:
+            if not self._queue.empty():
+                item = self._queue.get_nowait()
+            else:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            batch.append(item)
+            rows += len(item[0])
+
+        self._coalescing = len(batch) > 1
+        return batch
+
+    async def _run(self):
+        while True:
+            # 预测线程都忙时先不凑批，让请求继续积累成更大的批次
+            await self._slots.acquire()
+            batch = await self._collect()
+            task = asyncio.create_task(self._dispatch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._task_done)
+
+    def _task_done(self, task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"⚠️ 批处理任务异常: {task.exception()!r}")
+
+    def _predict_groups(self, groups):
+        """在工作线程里执行：每组输入拼成一个批次，用这组请求的模型只调用一次 predict"""
+        results = []
+        for items in groups:
+            model = items[0][3]
+            predict = model.predict if model is not None else self.predict
+            results.append(predict(_concat([data for data, _, _, _ in items])))
+        return results
+
+    async def _dispatch(self, batch):
+        try:
+            # 客户端断开时 future 会被取消，这些行就不用算了
+            batch = [item for item in batch if not item[1].done()]
+            if not batch:
+                return
+
+            now = time.perf_counter()
+            groups = {}
+            for item in batch:
+                groups.setdefault(_batch_key(item[0], item[3]), []).append(item)
+                if self.queue_wait is not None:
+                    self.queue_wait.observe(now - item[2])
+            groups = list(groups.values())
+
+            loop = asyncio.get_running_loop()
+            try:
+                results = await loop.run_in_executor(self._executor, self._predict_groups, groups)
+            except Exception as e:
+                for _, future, _, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+
+            for items, result in zip(groups, results):
+                if self.batch_rows is not None:
+                    self.batch_rows.observe(sum(len(data) for data, _, _, _ in items))
+                if self.batch_requests is not None:
+                    self.batch_requests.observe(len(items))
+                start = 0
+                for data, future, _, _ in items:
+                    end = start + len(data)
+                    if not future.done():
+                        future.set_result(_slice(result, start, end))
+                    start = end
+        finally:
+            self._slots.release()
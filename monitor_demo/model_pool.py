@@ -0,0 +1,116 @@
+# model_pool.py
+# 一个进程同时服务多个注册模型：/models/{name}/{version}/invocations
+# 已加载的 pyfunc 模型放在一个有上限的 LRU 里 (按模型个数和估算的内存)，第一次被请求时才加载；
+# 同一个模型被并发请求时只加载一次，其他请求等同一个加载任务。
+import asyncio
+import time
+from collections import OrderedDict
+
+from registry import load_version, resolve_version
+
+
+class ModelPool:
+    """
+    max_models: 最多同时加载多少个模型版本
+    max_bytes:  所有已加载模型的估算内存上限 (0 表示不限)；超出时淘汰最久没用过的模型
+    alias_ttl:  "Production"、"@champion"、"latest" 这类非数字版本解析结果的缓存时间 (秒)
+    metrics:    可选的 Prometheus 指标 dict (loads / load_seconds / evictions / loaded / loaded_bytes)
+    """
+
+    def __init__(self, max_models=4, max_bytes=0, alias_ttl=30.0, loader=load_version, metrics=None):
+        self.max_models = max_models
+        self.max_bytes = max_bytes
+        self.alias_ttl = alias_ttl
+        self.loader = loader
+        self.metrics = metrics or {}
+        self._models = OrderedDict()  # (name, version) -> LoadedModel，队尾是最近用过的
+        self._loading = {}            # (name, version) -> 正在进行的加载任务
+        self._aliases = {}            # (name, alias) -> (版本号, 过期时间)
+
+    def _observe(self, key, method, *args, **labels):
+        metric = self.metrics.get(key)
+        if metric is not None:
+            getattr(metric.labels(**labels) if labels else metric, method)(*args)
+
+    async def resolve(self, name, version):
+        """把 Production / @alias / latest 解析成具体的版本号 (带缓存)"""
+        if version.isdigit():
+            return version
+        cached = self._aliases.get((name, version))
+        if cached is not None and cached[1] > time.monotonic():
+            return cached[0]
+        if version == "latest":
+            resolved = await asyncio.to_thread(_latest_version, name)
+        else:
+            stage = version if version.startswith("@") else version.capitalize()
+            resolved = await asyncio.to_thread(resolve_version, name, stage)
+        if resolved is None:
+            raise KeyError(f"Model {name} has no version {version}")
+        self._aliases[(name, version)] = (resolved, time.monotonic() + self.alias_ttl)
+        return resolved
+
+    async def get(self, name, version):
+        """返回已加载的模型；没加载过就加载 (并发请求共享同一个加载任务)"""
+        version = await self.resolve(name, version)
+        key = (name, version)
+        loaded = self._models.get(key)
+        if loaded is not None:
+            self._models.move_to_end(key)
+            return loaded
+
+        task = self._loading.get(key)
+        if task is None:
+            task = asyncio.create_task(self._load(key))
+            self._loading[key] = task
+        # shield：某个请求断开不会取消其他请求也在等的加载任务
+        return await asyncio.shield(task)
+
+    async def _load(self, key):
+        name, version = key
+        started = time.perf_counter()
+        try:
+            loaded = await asyncio.to_thread(self.loader, name, version)
+        except Exception:
+            # 失败时 name 可能是客户端随便写的，不能当标签值 (否则任何人都能制造无限多的时间序列)
+            self._observe("loads", "inc", model="unknown", status="error")
+            raise
+        finally:
+            self._loading.pop(key, None)
+        self._observe("loads", "inc", model=name, status="success")
+        self._observe("load_seconds", "observe", time.perf_counter() - started)
+
+        self._models[key] = loaded
+        self._evict()
+        print(f"📦 Loaded {name} v{version} ({loaded.size_bytes / 2**20:.1f} MiB), {len(self._models)} models in memory")
+        return loaded
+
+    @property
+    def loaded_bytes(self):
+        return sum(m.size_bytes for m in self._models.values())
+
+    def _evict(self):
+        """淘汰最久没用过的模型，直到满足个数和内存上限 (至少保留刚加载的那个)"""
+        while len(self._models) > 1 and (
+            len(self._models) > self.max_models or (self.max_bytes and self.loaded_bytes > self.max_bytes)
+        ):
+            (name, version), _ = self._models.popitem(last=False)
+            # 正在用这个模型的请求还持有引用，会正常算完；之后由垃圾回收释放内存
+            self._observe("evictions", "inc", model=name)
+            print(f"🗑️ Evicted {name} v{version}")
+        self._observe("loaded", "set", len(self._models))
+        self._observe("loaded_bytes", "set", self.loaded_bytes)
+
+
+# 表示 "模型/版本不存在" 的 MLflow 错误码 (其他错误，例如注册表连不上，不算)
+_NOT_FOUND_CODES = ("RESOURCE_DOES_NOT_EXIST", "INVALID_PARAMETER_VALUE")
+
+
+def is_not_found(exc):
+    """加载失败是不是因为模型/版本不存在 (返回 404)，否则是服务端的问题 (返回 503)"""
+    return isinstance(exc, KeyError) or getattr(exc, "error_code", None) in _NOT_FOUND_CODES
+
+
+def _latest_version(name):
+    from mlflow.tracking import MlflowClient
+    versions = MlflowClient().search_model_versions(f"name='{name}'")
+    return str(max(int(v.version) for v in versions)) if versions else None
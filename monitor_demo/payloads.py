@@ -0,0 +1,151 @@
+# payloads.py
+# /invocations 的输入解析和输出编码 (快速路径)：
+# 请求体直接转成 NumPy 数组，只有模型签名要求按列输入时才构造 DataFrame；
+# 输出用 orjson 直接序列化 NumPy 数组，不经过 tolist()。
+import json
+from typing import List, Optional
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:  # 没装 orjson 时退回标准库 json
+    orjson = None
+
+JSON = "application/json"
+ARROW = "application/vnd.apache.arrow.stream"
+RAW = "application/octet-stream"
+# 原始二进制输入的形状/类型放在请求头里，例如 X-Tensor-Shape: 2,4
+SHAPE_HEADER = "x-tensor-shape"
+DTYPE_HEADER = "x-tensor-dtype"
+
+
+class PayloadError(ValueError):
+    """请求体格式不对 (返回给调用方的错误信息)"""
+
+
+def parse_payload(body: bytes, content_type: str, headers=None, frames: bool = False):
+    """
+    请求体 -> (二维 NumPy 数组或 DataFrame, 列名或 None)
+    支持：
+    - application/json: {"dataframe_split": {"columns": [...], "data": [[...]]}}、{"dataframe_records": [{...}]}、
+      {"instances": [[...]]}、{"inputs": [[...]]}，其他 JSON (例如 {"列名": [值, ...]}) 按 pd.DataFrame(json) 解析
+    - application/vnd.apache.arrow.stream: Arrow IPC stream，每列一个特征 (frames=True 时转成 DataFrame)
+    - application/octet-stream: 原始的行优先数组，形状写在 X-Tensor-Shape，类型写在 X-Tensor-Dtype (默认 float32)
+    frames=True (模型签名按列)：按列的 JSON 直接用原始数据构造 DataFrame，每列保留自己的类型；
+    否则拼成一个 NumPy 数组 (混合类型的行会被统一成字符串/object，只适合数值输入)
+    """
+    content_type = (content_type or JSON).split(";")[0].strip().lower()
+    if content_type == RAW:
+        return _parse_raw(body, headers or {}), None
+    if content_type == ARROW:
+        return _parse_arrow(body, frames)
+    if content_type != JSON:
+        raise PayloadError(f"Unsupported content type: {content_type}")
+
+    try:
+        payload = orjson.loads(body) if orjson is not None else json.loads(body)
+    except ValueError as e:
+        raise PayloadError(f"Invalid JSON: {e}")
+    if isinstance(payload, dict):
+        for key in ("instances", "inputs"):
+            if key in payload:
+                # 单条样本 [x1, x2, ...] 也当成一行
+                return np.atleast_2d(_array(payload[key])), None
+        if "dataframe_split" in payload:
+            split = payload["dataframe_split"]
+            if not isinstance(split, dict) or "data" not in split:
+                raise PayloadError('dataframe_split must be an object like {"columns": [...], "data": [[...]]}')
+            if not frames:
+                return _array(split["data"]), split.get("columns")
+            return _frame(**split)
+        if "dataframe_records" in payload:
+            return _frame(payload["dataframe_records"], as_array=not frames)
+    # 兜底：和 pd.DataFrame(json) 一样，按列的 dict 或记录列表
+    return _frame(payload, as_array=not frames)
+
+
+def _array(data) -> np.ndarray:
+    """JSON 里的嵌套列表 -> NumPy 数组 (每行长度不一致等问题报 PayloadError)"""
+    try:
+        return np.asarray(data)
+    except (TypeError, ValueError) as e:
+        raise PayloadError(f"Cannot convert the payload to an array: {e}")
+
+
+def _frame(*args, as_array: bool = False, **kwargs):
+    import pandas as pd
+    try:
+        frame = pd.DataFrame(*args, **kwargs)
+    except (TypeError, ValueError) as e:
+        raise PayloadError(f"Cannot build a DataFrame from the payload: {e}")
+    columns = [str(c) for c in frame.columns]
+    return (frame.to_numpy(), columns) if as_array else (frame, columns)
+
+
+def _parse_raw(body: bytes, headers) -> np.ndarray:
+    shape = headers.get(SHAPE_HEADER)
+    if not shape:
+        raise PayloadError(f"Missing {SHAPE_HEADER} header")
+    try:
+        dtype = np.dtype(headers.get(DTYPE_HEADER, "float32"))
+        # frombuffer 不复制数据，直接在请求体上建视图
+        return np.frombuffer(body, dtype=dtype).reshape([int(n) for n in shape.split(",")])
+    except (TypeError, ValueError) as e:
+        raise PayloadError(f"Bad {SHAPE_HEADER}/{DTYPE_HEADER} for a {len(body)}-byte body: {e}")
+
+
+def _parse_arrow(body: bytes, frames: bool = False):
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise PayloadError("Arrow input requires pyarrow")
+    try:
+        table = pa.ipc.open_stream(body).read_all()
+    except pa.ArrowInvalid as e:
+        raise PayloadError(f"Invalid Arrow stream: {e}")
+    if frames:
+        # 按列签名的模型：每列保留自己的类型，不拼成同一个 dtype
+        return table.to_pandas(), table.column_names
+    columns = [column.to_numpy() for column in table.columns]
+    return np.column_stack(columns), table.column_names
+
+
+class InputAdapter:
+    """
+    按模型签名把 NumPy 数组转成模型要的输入 (签名只读一次)：
+    - 张量签名 (例如用 NumPy input_example 记录的模型) 或没有签名：直接传数组，只在类型不同时转换
+    - 按列的签名：才构造 DataFrame
+    """
+
+    def __init__(self, model):
+        schema = model.metadata.get_input_schema()
+        self.tensor = schema is None or schema.is_tensor_spec()
+        self.dtype = schema.numpy_types()[0] if schema is not None and self.tensor else None
+        self.columns = None if self.tensor else schema.input_names()
+
+    def adapt(self, array, columns: Optional[List[str]] = None):
+        if hasattr(array, "iloc"):  # parse_payload(frames=True) 已经构造好的 DataFrame
+            if not self.tensor:
+                return array
+            array = array.to_numpy()
+        if self.tensor:
+            return array if self.dtype is None else array.astype(self.dtype, copy=False)
+        import pandas as pd
+        return pd.DataFrame(array, columns=columns or self.columns)
+
+
+def encode_json(content) -> bytes:
+    """orjson 可以直接序列化 NumPy 数组 (不需要 tolist())"""
+    if orjson is not None:
+        # orjson 不支持的数组 (例如 object 类型、非连续数组) 退回 tolist()
+        return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY, default=_to_list)
+    return json.dumps(content, default=_to_list).encode("utf-8")
+
+
+def _to_list(obj):
+    if hasattr(obj, "to_numpy"):  # pandas 的 Series / DataFrame
+        obj = obj.to_numpy()
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
@@ -0,0 +1,43 @@
+# profiler.py
+# 采样 profiler (纯 Python，不需要额外依赖)：
+# 每隔 interval 秒抓一次所有线程的调用栈 (sys._current_frames)，统计每条调用栈出现的次数。
+# 输出 "折叠栈" 格式 (每行 `函数1;函数2;函数3 次数`)，可以直接交给 flamegraph.pl / speedscope 画火焰图。
+# 只在采样期间有开销，适合在线上负载下临时抓一段热点。
+import collections
+import sys
+import threading
+import time
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})"
+
+
+def _stack(frame, max_depth):
+    names = []
+    while frame is not None and len(names) < max_depth:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def sample(seconds=5.0, interval=0.005, max_depth=64):
+    """阻塞采样 seconds 秒 (放到线程里调用)，返回 {折叠栈: 次数}"""
+    me = threading.get_ident()
+    names = {t.ident: t.name for t in threading.enumerate()}
+    counts = collections.Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue  # 不统计采样线程自己
+            counts[f"{names.get(ident, ident)};{_stack(frame, max_depth)}"] += 1
+        time.sleep(interval)
+    return counts
+
+
+def folded(counts, limit=0):
+    """{栈: 次数} -> 折叠栈文本，按次数从多到少 (limit > 0 时只保留前 limit 条)"""
+    items = counts.most_common(limit or None)
+    return "\n".join(f"{stack} {count}" for stack, count in items) + "\n"
@@ -0,0 +1,116 @@
+# registry.py
+# 从 MLflow Model Registry 热更新模型：
+# 定期查询 models:/<name>/<stage> 当前指向的版本，发现新版本后在后台线程加载、用 input_example 预热，
+# 再原子地替换正在服务的模型 (替换只是一次引用赋值，正在处理的请求继续用旧模型算完)，不需要重启容器。
+import asyncio
+import os
+
+import mlflow
+import mlflow.artifacts
+import mlflow.pyfunc
+from mlflow.tracking import MlflowClient
+
+from payloads import InputAdapter
+
+
+class LoadedModel:
+    """一个已加载、已预热的模型版本"""
+
+    def __init__(self, name, version, model, size_bytes=0):
+        self.name = name
+        self.version = str(version)
+        self.model = model
+        self.size_bytes = size_bytes  # 模型文件大小，用来估算占用的内存
+        # 模型签名只解析一次
+        self.adapter = InputAdapter(model)
+
+    def predict(self, data):
+        return self.model.predict(data)
+
+
+def resolve_version(name, stage="Production", client=None):
+    """models:/<name>/<stage> 当前指向的版本号 (stage 以 @ 开头时按别名查)，没有则返回 None"""
+    client = client or MlflowClient()
+    if stage.startswith("@"):
+        return str(client.get_model_version_by_alias(name, stage[1:]).version)
+    versions = client.get_latest_versions(name, stages=[stage])
+    return str(versions[0].version) if versions else None
+
+
+def warm_up(loaded):
+    """用记录模型时保存的 input_example 跑一次预测：触发懒加载、检查输入格式，避免第一个请求变慢"""
+    try:
+        example = loaded.model.input_example
+    except Exception:
+        example = None
+    if example is None:
+        print(f"ℹ️ {loaded.name} v{loaded.version} 没有 input_example，跳过预热")
+        return
+    loaded.predict(example)
+
+
+def _dir_size(path):
+    return sum(
+        os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files
+    )
+
+
+def load_version(name, version):
+    """下载、加载并预热指定版本 (阻塞调用，放到线程里执行)"""
+    # 先下载到本地再加载，顺便得到模型文件的大小 (反序列化后的 sklearn 模型内存占用和它差不多)
+    local_path = mlflow.artifacts.download_artifacts(f"models:/{name}/{version}")
+    model = mlflow.pyfunc.load_model(local_path)
+    loaded = LoadedModel(name, version, model, size_bytes=_dir_size(local_path))
+    warm_up(loaded)
+    return loaded
+
+
+class RegistryWatcher:
+    """
+    轮询注册表，发现 stage 指向了新版本时，后台加载 + 预热，成功后调用 on_swap(新模型)
+    加载失败不影响正在服务的旧模型，下一轮轮询会重试
+    """
+
+    def __init__(self, name, stage, current_version, on_swap, poll_seconds=30.0, on_error=None):
+        self.name = name
+        self.stage = stage
+        self.current_version = current_version
+        self.on_swap = on_swap
+        self.on_error = on_error
+        self.poll_seconds = poll_seconds
+        self._task = None
+
+    async def start(self):
+        if self.poll_seconds > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.poll_seconds)
+            try:
+                await self.check()
+            except Exception as e:
+                print(f"⚠️ 检查/加载 {self.name} 新版本失败: {e}")
+                if self.on_error is not None:
+                    self.on_error(e)
+
+    async def check(self):
+        """查一次注册表，有新版本就加载并替换，返回是否替换了"""
+        version = await asyncio.to_thread(resolve_version, self.name, self.stage)
+        if version is None or version == self.current_version:
+            return False
+        print(f"🔄 发现 {self.name} 新版本 v{version} ({self.stage})，后台加载中...")
+        loaded = await asyncio.to_thread(load_version, self.name, version)
+        self.current_version = version
+        self.on_swap(loaded)
+        print(f"✅ 已切换到 {self.name} v{version}")
+        return True